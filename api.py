@@ -1,90 +1,555 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import numpy as np
-import requests
 import json
 
 # Fix Numpy 2.0
 if not hasattr(np, 'float_'):
     np.float_ = np.float64
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
-from opensearchpy import OpenSearch
-from sentence_transformers import SentenceTransformer
+from opensearchpy import helpers
+
+from ingest import INDEX_NAME, MODEL_NAME, embedding_info, get_client, get_embedding_meta, get_last_import, load_model
+from live_writer import BulkWriter
+from related import RELATED_DIR, RelatedTable
+from ollama_client import OLLAMA_MODEL, OLLAMA_URL, CircuitBreaker, OllamaClient
+from query_log import QueryLogger, stage
+from semantic_cache import SemanticCache
+from suggest import PrefixIndex, catalog_weights, vocabulary_terms
+from text_builder import LEGACY_TEXT, TextBuilder
 
 app = FastAPI(title="White Rose's AI Search")
 
-# --- จุดสำคัญ: แก้ Config ให้เหมือนตอน Import CSV ---
-client = OpenSearch(
-    hosts=[{'host': 'localhost', 'port': 9200}],
-    http_compress=True,
-    use_ssl=False,          # <--- ปิด SSL
-    verify_certs=False,
-    timeout=30
+# --- จุดสำคัญ: Config มาจาก ingest.py ที่เดียวกับตอน Import ---
+client = get_client(timeout=30)
+
+
+class Encoder:
+    """โมเดลที่ใช้ encode query คู่กับ field ใน index ที่ vector มาจากโมเดลเดียวกัน (สลับทั้งคู่พร้อมกันเสมอ)"""
+
+    def __init__(self, info):
+        self.version = info["version"]
+        self.model_name = info["model"]
+        self.field = info["field"]
+        self.model = load_model(self.model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        # query ต้องผ่าน normalize / ตัดคำซ้ำแบบเดียวกับตอนสร้างข้อความของสินค้า
+        self.text = TextBuilder.from_config(info.get("text", LEGACY_TEXT), self.model)
+        if info.get("dimension") and info["dimension"] != self.dimension:
+            raise RuntimeError(f"{self.model_name} ให้ vector {self.dimension} มิติ "
+                               f"แต่ index เก็บ {info['dimension']} มิติไว้ใน '{self.field}'")
+
+    def matches(self, info):
+        return ((info["version"], info["model"], info["field"], info.get("text", LEGACY_TEXT)) ==
+                (self.version, self.model_name, self.field, self.text.config()))
+
+    def encode(self, text):
+        return self.model.encode(self.text.query(text))
+
+    def describe(self):
+        return {"version": self.version, "model": self.model_name, "field": self.field, "dimension": self.dimension,
+                "text": self.text.config()}
+
+
+def active_embedding():
+    try:
+        return get_embedding_meta(client, INDEX_NAME)["active"]
+    except Exception as e:
+        # ยังไม่เคย import (ไม่มี index): ใช้โมเดลหลักไปก่อน watcher จะเช็คใหม่เมื่อ index ถูกสร้าง
+        print(f"⚠️ อ่าน embedding metadata ไม่ได้ ({e}) - ใช้ {MODEL_NAME} ไปก่อน")
+        return embedding_info(MODEL_NAME, None)
+
+
+# โมเดลต้องตรงกับที่ใช้ Import ข้อมูล: อ่านจาก _meta ของ index ไม่ hardcode (ไม่ตรงก็ไม่ยอม start)
+encoder = Encoder(active_embedding())
+
+# --- Semantic cache: query ที่ความหมายใกล้กันใช้ผลเดิม (ปรับผ่าน env ได้) ---
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "600"))
+INDEX_CHECK_INTERVAL = float(os.getenv("INDEX_CHECK_INTERVAL", "30"))  # วินาที, เช็คว่า index ถูก reload ไหม
+
+query_cache = SemanticCache(
+    encoder.dimension,
+    max_size=SEMANTIC_CACHE_SIZE,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl=SEMANTIC_CACHE_TTL,
 )
 
-# เลือกโมเดลให้ตรงกับที่ใช้ Import ข้อมูล (แนะนำตัวเก่งภาษาไทย)
-model = SentenceTransformer('paraphrase-multilingual-mpnet-base-v2')
-INDEX_NAME = "ecommerce_products"
+# --- Latency budget ต่อ 1 request /search (วินาที) ---
+SEARCH_LATENCY_BUDGET = float(os.getenv("SEARCH_LATENCY_BUDGET", "2.5"))
+SEARCH_RESERVE = float(os.getenv("SEARCH_RESERVE", "0.4"))  # กันเวลาไว้ให้ encode + k-NN หลังขยายความ
 
-# ฟังก์ชันคุยกับ Ollama
-def ask_ollama(user_query):
-    print(f"🤖 AI Thinking: {user_query}")
+ollama = OllamaClient(
+    base_url=os.getenv("OLLAMA_URL", OLLAMA_URL),
+    model=os.getenv("OLLAMA_MODEL", OLLAMA_MODEL),
+    max_concurrency=int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4")),
+    max_timeout=float(os.getenv("OLLAMA_TIMEOUT", "5")),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("OLLAMA_BREAKER_FAILURES", "3")),
+        slow_threshold=float(os.getenv("OLLAMA_BREAKER_SLOW", "2.0")),
+        reset_timeout=float(os.getenv("OLLAMA_BREAKER_RESET", "30")),
+    ),
+)
+
+# --- Speculative search: ค้นคำดิบคู่ขนานกับการขยายความ ---
+SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "1") == "1"
+EXPANSION_DEADLINE = float(os.getenv("EXPANSION_DEADLINE", "0.8"))  # รอ AI ได้นานสุดกี่วินาที ก่อนตอบผลคำดิบ
+EXPANSION_CACHE_SIZE = int(os.getenv("EXPANSION_CACHE_SIZE", "4096"))
+
+# k-NN กับงานขยายความแยก pool กัน: งาน AI ค้างได้เป็นวินาที (รอคิว Ollama / คำขยายที่ตอบช้ายังวิ่งต่อหลังตอบไปแล้ว)
+# ถ้าใช้ pool เดียวกัน k-NN ของคำดิบจะต่อคิวหลังงาน AI จนผลสำรองไม่ทัน deadline
+search_pool = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_WORKERS", "16")), thread_name_prefix="search")
+expansion_pool = ThreadPoolExecutor(max_workers=int(os.getenv("EXPANSION_WORKERS", "16")),
+                                    thread_name_prefix="expansion")
+
+# --- Query log: สุ่มเก็บ query จริงไว้ replay ทดสอบ build ใหม่ (ดู replay_queries.py) ---
+query_logger = QueryLogger(
+    directory=os.getenv("QUERY_LOG_DIR", "query_logs"),
+    sample_rate=float(os.getenv("QUERY_LOG_SAMPLE", "0.1")),
+    max_bytes=int(float(os.getenv("QUERY_LOG_MAX_MB", "50")) * 1024 * 1024),
+    backup_count=int(os.getenv("QUERY_LOG_BACKUPS", "10")),
+)
+
+# คำขยายของ query ที่เคยถาม AI แล้ว (ไม่ผูกกับข้อมูลใน index จึงไม่ต้องล้างตอน reload)
+_expansions = OrderedDict()
+_expansions_lock = threading.Lock()
+
+
+def cached_expansion(q):
+    with _expansions_lock:
+        expanded = _expansions.get(q)
+        if expanded is not None:
+            _expansions.move_to_end(q)
+        return expanded
+
+
+def remember_expansion(q, expanded):
+    with _expansions_lock:
+        _expansions[q] = expanded
+        _expansions.move_to_end(q)
+        while len(_expansions) > EXPANSION_CACHE_SIZE:
+            _expansions.popitem(last=False)
+
+
+# --- ตาราง cross-sell ที่คำนวณล่วงหน้าด้วย related.py ---
+RELATED_TABLE_PATH = os.getenv("RELATED_TABLE_PATH", RELATED_DIR)
+related_table = None
+_related_mtime = None
+
+
+def reload_related_table():
+    """โหลดตารางใหม่เมื่อ related.py สร้างชุดใหม่เสร็จ (ดูจากเวลาแก้ไข meta.json)"""
+    global related_table, _related_mtime
+    meta_path = os.path.join(RELATED_TABLE_PATH, "meta.json")
+    if not os.path.exists(meta_path):
+        return
+    mtime = os.path.getmtime(meta_path)
+    if mtime == _related_mtime:
+        return
+    related_table = RelatedTable.load(RELATED_TABLE_PATH)  # สลับทั้งก้อนทีเดียว request ที่ค้างอยู่ใช้ตัวเก่าต่อได้
+    _related_mtime = mtime
+    print(f"🔗 Related table loaded: {related_table.meta['count']:,} items ({related_table.meta['built_at']})")
+
+
+reload_related_table()
+
+# --- Typeahead: prefix index ในแรม สร้างจาก title ใน catalog + vocab ของตัวสร้างข้อมูล ---
+suggest_index = PrefixIndex(limit=int(os.getenv("SUGGEST_LIMIT", "8")))
+_vocabulary = vocabulary_terms()
+
+
+def rebuild_suggestions():
+    t0 = time.perf_counter()
     try:
-        url = "http://localhost:11434/api/generate"
-        prompt = f"""Task: Extract product keywords for supermarket search.
-        Query: "{user_query}"
-        Output: Just list 3-5 keywords in Thai separated by space. No explanation."""
-        
-        payload = {"model": "llama3.2", "prompt": prompt, "stream": False}
-        res = requests.post(url, json=payload, timeout=5) # timeout 5 วิ กันรอนาน
-        return res.json()['response'].strip()
-    except:
-        return user_query # ถ้า Ollama ช้าหรือไม่เปิด ให้ใช้คำเดิม
+        query = {"_source": ["title"], "query": {"match_all": {}}}
+        titles = [hit['_source']['title'] for hit in helpers.scan(client, index=INDEX_NAME, query=query, size=2000)
+                  if hit['_source'].get('title')]
+    except Exception as e:
+        print(f"⚠️ Suggest: อ่าน catalog ไม่ได้ ใช้แค่ vocab ไปก่อน ({e})")
+        titles = []
+    suggest_index.update(catalog_weights(titles, _vocabulary))
+    print(f"🔤 Suggest index ready: {len(suggest_index):,} terms in {time.perf_counter() - t0:.1f}s")
 
-@app.get("/search")
-def search_products(q: str):
-    # 1. ขยายความด้วย AI
-    expanded = ask_ollama(q)
-    final_query = f"{q} {expanded}"
-    print(f"🔎 Final Search: {final_query}")
 
-    # 2. แปลง Vector
-    query_vector = model.encode(final_query).tolist()
+def schedule_suggest_rebuild():
+    # อ่าน catalog ทั้งหมดใช้เวลาหลายวินาที ไม่ให้ request ที่เรียก reload ต้องรอ
+    threading.Thread(target=rebuild_suggestions, name="suggest-rebuild", daemon=True).start()
+
+
+# --- Live upsert: แก้ราคา/สต็อก/สินค้าใหม่ ผ่าน API แล้วให้ writer ทยอยเขียนเป็นก้อน ---
+WRITER_MAX_BATCH = int(os.getenv("WRITER_MAX_BATCH", "500"))
+WRITER_MAX_WAIT = float(os.getenv("WRITER_MAX_WAIT", "1.0"))
+WRITER_MAX_PENDING = int(os.getenv("WRITER_MAX_PENDING", "50000"))
+WRITER_SHARE_MODEL = os.getenv("WRITER_SHARE_MODEL", "0") == "1"  # 1 = ประหยัดแรม แต่ encode แย่งกับ /search
+
+
+class ProductIn(BaseModel):
+    id: str
+    title: Optional[str] = None
+    description: Optional[str] = None
+    category: Optional[str] = None
+    price: Optional[float] = None
+    stock: Optional[int] = None
+
+
+# การแก้ title จาก writer: รวมไว้ก่อนแล้วให้ thread แยก apply (PrefixIndex.add ใช้เวลาหลายร้อย ms ต่อครั้ง)
+_suggest_delta = Counter()
+_suggest_cond = threading.Condition()
+
+
+def apply_suggest_deltas():
+    while True:
+        with _suggest_cond:
+            while not _suggest_delta:
+                _suggest_cond.wait()
+            delta = {term: weight for term, weight in _suggest_delta.items() if weight}
+            _suggest_delta.clear()
+        try:
+            if delta:
+                suggest_index.add(delta)
+        except Exception as e:
+            print(f"⚠️ Suggest update failed: {e}")
+
+
+def on_products_written(changed_ids, new_sources, previous):
+    # ลบเฉพาะผลค้นหาใน cache ที่มีสินค้าที่เพิ่งเปลี่ยน ไม่ต้องล้างทั้งหมด
+    query_cache.discard(lambda value: any(item.get("id") in changed_ids for item in value["data"]))
+    # title เดิมของสินค้าที่แก้ / ลบ -1, title ใหม่ +1 (แก้ข้อความแต่ชื่อเดิม = หักล้างกันเป็น 0)
+    delta = Counter()
+    for src in previous.values():
+        if src.get("title"):
+            delta[(src["title"], "title")] -= 1
+    for src in new_sources.values():
+        delta[(src["title"], "title")] += 1
+    delta = {term: weight for term, weight in delta.items() if weight}
+    if delta:
+        with _suggest_cond:
+            _suggest_delta.update(delta)
+            _suggest_cond.notify()
+
+
+writer = BulkWriter(
+    client,
+    (lambda: encoder.model) if WRITER_SHARE_MODEL else (lambda: load_model(encoder.model_name)),
+    max_batch=WRITER_MAX_BATCH,
+    max_wait=WRITER_MAX_WAIT,
+    max_pending=WRITER_MAX_PENDING,
+    on_flush=on_products_written,
+    vector_field=encoder.field,
+    text_config=encoder.text.config(),
+)
+
+
+def check_embedding_switch():
+    """reembed.py ย้ายโมเดลเสร็จ (active ใน _meta เปลี่ยน) -> โหลดโมเดลใหม่แล้วสลับ encoder + field ทีเดียว"""
+    global encoder
+    active = get_embedding_meta(client, INDEX_NAME)["active"]
+    if encoder.matches(active):
+        return
+    print(f"🔀 Embedding v{encoder.version} -> v{active['version']}: loading {active['model']}...")
+    # โหลดโมเดลใน watcher thread ระหว่างนี้ /search ยังใช้ตัวเก่ากับ field เก่าที่ยังอยู่ครบ
+    new_encoder = Encoder(active)
+    encoder = new_encoder
+    writer.set_embedding(new_encoder.field, new_encoder.text.config())
+    query_cache.invalidate(new_encoder.dimension)  # vector ของ query เก่ามาจากโมเดลอื่น เทียบกันไม่ได้แล้ว
+    print(f"✅ Serving embedding v{new_encoder.version} ({new_encoder.model_name}, field '{new_encoder.field}')")
+
+# ฟังก์ชันที่ต้องเรียกเมื่อข้อมูลใน index เปลี่ยน (import ใหม่ / ลบสร้างใหม่)
+reload_hooks = [query_cache.invalidate, reload_related_table, schedule_suggest_rebuild]
+
+
+def on_index_reload(reason):
+    print(f"♻️  Index changed ({reason}) - refreshing in-memory caches")
+    for hook in reload_hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"⚠️ Reload hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+
+def index_fingerprint():
+    """uuid เปลี่ยน = index ถูกลบสร้างใหม่, last_import เปลี่ยน = ingest.py import เพิ่ม (append)
+
+    ไม่ใช้จำนวน doc: สินค้าใหม่ / ที่ลบผ่าน /products ก็เปลี่ยนจำนวน แต่ writer จัดการ cache ของตัวเองแล้ว
+    """
+    stats = client.indices.stats(index=INDEX_NAME, metric="docs")["indices"][INDEX_NAME]
+    last_import = get_last_import(client, INDEX_NAME) or {}
+    return stats.get("uuid"), last_import.get("at")
+
+
+INDEX_UNAVAILABLE = ("unavailable",)   # fingerprint ตอนยังไม่มี index / ต่อ OpenSearch ไม่ได้
+
+
+def watch_index():
+    last = None
+    while True:
+        try:
+            check_embedding_switch()
+        except Exception as e:
+            print(f"⚠️ Embedding switch: {e}")
+        try:
+            reload_related_table()   # รัน related.py แยกเองก็รับตารางใหม่ ไม่ต้องรอ index เปลี่ยน
+        except Exception as e:
+            print(f"⚠️ Related table: {e}")
+        try:
+            current = index_fingerprint()
+            if last is not None and current != last:
+                on_index_reload(f"{last} -> {current}")
+            last = current
+        except Exception as e:
+            # ยังไม่มี index (start api ก่อน import) หรือ OpenSearch ล่ม: cache / suggest ตอน start สร้างจากของว่าง
+            # จำไว้ว่า "ไม่มี" พอกลับมาเห็น index ค่อย reload ทีเดียว (ไม่งั้นรอบแรกที่เห็นแค่จดไว้ ไม่ reload)
+            if last != INDEX_UNAVAILABLE:
+                print(f"⚠️ Index watcher: {e}")
+            last = INDEX_UNAVAILABLE
+        time.sleep(INDEX_CHECK_INTERVAL)
+
 
-    # 3. ค้นหาใน OpenSearch
+@app.on_event("startup")
+def start_index_watcher():
+    threading.Thread(target=watch_index, name="index-watcher", daemon=True).start()
+    threading.Thread(target=apply_suggest_deltas, name="suggest-updates", daemon=True).start()
+    schedule_suggest_rebuild()
+    writer.start()
+    query_logger.start()
+
+
+@app.on_event("shutdown")
+def flush_writer():
+    writer.stop()
+    query_logger.stop()
+
+# ฟังก์ชันคุยกับ Ollama (ผ่าน connection pool + circuit breaker)
+def ask_ollama(user_query, deadline=None):
+    print(f"🤖 AI Thinking: {user_query}")
+    prompt = f"""Task: Extract product keywords for supermarket search.
+    Query: "{user_query}"
+    Output: Just list 3-5 keywords in Thai separated by space. No explanation."""
+
+    expanded = ollama.generate(prompt, deadline=deadline)
+    return expanded or user_query # ถ้า Ollama ช้า/ไม่เปิด/breaker ตัดอยู่ ให้ใช้คำเดิม
+
+def knn_search(vector, k=10, min_score=0.4, field=None):
     query_body = {
-        "size": 10,
+        "size": k,
+        "_source": {"excludes": ["vector_embedding*"]}, # ไม่ต้องส่ง vector 768 ตัวกลับมาด้วย (ทุก version)
         "query": {
             "knn": {
-                "vector_embedding": {
-                    "vector": query_vector,
-                    "k": 10
+                field or encoder.field: {
+                    "vector": vector.tolist() if hasattr(vector, "tolist") else vector,
+                    "k": k
                 }
             }
         }
     }
-    
+    response = client.search(index=INDEX_NAME, body=query_body)
+    results = []
+    for hit in response['hits']['hits']:
+        # กรอง Score ต่ำๆ ทิ้ง
+        if hit['_score'] < min_score: continue
+
+        src = hit['_source']
+        results.append({
+            "id": hit['_id'],
+            "title": src.get('title'),
+            "price": src.get('price'),
+            "category": src.get('category'),
+            "description": src.get('description'),
+            "score": hit['_score']
+        })
+    return results
+
+
+def merge_results(*result_lists, k=10):
+    """รวมผลหลายชุด ตัวซ้ำเก็บ score สูงสุด"""
+    best = {}
+    for results in result_lists:
+        for item in results:
+            if item["id"] not in best or item["score"] > best[item["id"]]["score"]:
+                best[item["id"]] = item
+    return sorted(best.values(), key=lambda item: item["score"], reverse=True)[:k]
+
+
+def expand_and_remember(q, deadline, timings):
+    with stage(timings, "expansion"):
+        expanded = ask_ollama(q, deadline=deadline)
+    if expanded != q:
+        remember_expansion(q, expanded)
+    return expanded
+
+
+def raw_search(vector, enc, timings):
+    with stage(timings, "knn_raw"):
+        return knn_search(vector, field=enc.field)
+
+
+def search_expanded(q, expanded, enc, timings):
+    final_query = f"{q} {expanded}"
+    print(f"🔎 Final Search: {final_query}")
+    with stage(timings, "encode_expanded"):
+        vector = enc.encode(final_query)
+    with stage(timings, "knn_expanded"):
+        return knn_search(vector, field=enc.field)
+
+
+def log_query(q, started, timings, enc, speculative, payload):
+    cache = payload.get("cache", {})
+    query_logger.log({
+        "ts": round(time.time(), 3),
+        "q": q,
+        "speculative": speculative,
+        "served_by": "semantic_cache" if cache.get("hit") else payload.get("served_by"),
+        "expansion": payload.get("ai_thought"),
+        "cache_similarity": cache.get("similarity"),
+        "embedding_version": enc.version,
+        "total_ms": round((time.perf_counter() - started) * 1000, 2),
+        "stages": dict(timings),   # copy: คำขยายที่ตอบช้ายังเขียน timings ต่อจาก thread อื่นได้
+        "results": [[item["id"], round(item["score"], 4)] for item in payload.get("data", [])],
+        "error": payload.get("error"),
+    })
+
+
+@app.get("/search")
+def search_products(q: str, speculative: bool = SPECULATIVE_SEARCH, expansion: Optional[str] = None,
+                    use_cache: bool = True):
+    """expansion / use_cache=false มีไว้ให้ replay_queries.py ตรึงคำขยายจาก log (ผลจะไม่ขึ้นกับ AI รอบนั้น)"""
+    started = time.perf_counter()
+    deadline = time.monotonic() + SEARCH_LATENCY_BUDGET
+    timings = {}
+
+    # จับ encoder ไว้ตัวเดียวตลอด request: ถ้าสลับโมเดลกลางทาง vector กับ field ยังมาจากโมเดลเดียวกัน
+    # (อ่าน generation ก่อน encoder: สลับโมเดลระหว่างนี้ผลจะไม่ถูกเก็บลง cache)
+    generation = query_cache.generation
+    enc = encoder
+
+    # 0. ถามเรื่องที่เคยถามแล้ว (ความหมายใกล้กัน) -> ตอบจาก cache ไม่ต้องเรียก AI / DB
+    with stage(timings, "encode"):
+        raw_vector = enc.encode(q)
+    cached = None
+    if use_cache:
+        with stage(timings, "semantic_cache"):
+            cached = query_cache.get(raw_vector)
+    if cached is not None:
+        value, similarity, matched = cached
+        response = {**value, "cache": {"hit": True, "similarity": round(similarity, 4), "matched_query": matched}}
+        log_query(q, started, timings, enc, speculative, response)
+        return response
+
     try:
-        response = client.search(index=INDEX_NAME, body=query_body)
-        results = []
-        for hit in response['hits']['hits']:
-            # กรอง Score ต่ำๆ ทิ้ง
-            if hit['_score'] < 0.4: continue 
-            
-            src = hit['_source']
-            results.append({
-                "title": src.get('title'),
-                "price": src.get('price'),
-                "category": src.get('category'),
-                "description": src.get('description'),
-                "score": hit['_score']
-            })
-        return {"data": results, "ai_thought": expanded}
+        expanded = expansion or cached_expansion(q)
+        if expanded is not None:
+            # เคยขยายคำนี้แล้ว (เช่นรอบก่อนที่ AI ตอบไม่ทัน) หรือ replay ส่งคำขยายมาให้ -> ไม่ต้องถาม AI ซ้ำ
+            raw_future = search_pool.submit(raw_search, raw_vector, enc, timings)
+            if expanded == q:
+                results = raw_future.result()
+            else:
+                results = merge_results(search_expanded(q, expanded, enc, timings), raw_future.result())
+            served_by = "pinned" if expansion else "expansion_cache"
+        elif not speculative:
+            # 1. ขยายความด้วย AI -> 2. แปลง Vector -> 3. ค้นหา (ทีละขั้นแบบเดิม)
+            expanded = expand_and_remember(q, deadline - SEARCH_RESERVE, timings)
+            results = search_expanded(q, expanded, enc, timings)
+            served_by = "expanded" if expanded != q else "raw_fallback"
+        else:
+            # Speculative: ค้นด้วยคำดิบไปก่อนเลย ระหว่างรอ AI ขยายความ
+            expansion_future = expansion_pool.submit(expand_and_remember, q, deadline - SEARCH_RESERVE, timings)
+            expansion_due = min(time.monotonic() + EXPANSION_DEADLINE, deadline - SEARCH_RESERVE)
+            # k-NN คำดิบทำใน request thread เอง ไม่ต้องรอ worker ว่าง ผลสำรองจึงพร้อมเสมอ
+            raw_results = raw_search(raw_vector, enc, timings)
+            try:
+                with stage(timings, "expansion_wait"):
+                    expanded = expansion_future.result(timeout=max(0.0, expansion_due - time.monotonic()))
+            except FutureTimeout:
+                # AI ตอบไม่ทัน: ตอบผลคำดิบไปก่อน ส่วนคำขยายจะถูกเก็บลง cache เมื่อ AI ตอบเสร็จ
+                expanded = None
+
+            if expanded is None:
+                results, served_by = raw_results, "raw_deadline"
+            elif expanded == q:
+                results, served_by = raw_results, "raw_fallback"
+            else:
+                results = merge_results(search_expanded(q, expanded, enc, timings), raw_results)
+                served_by = "expanded+raw"
+
+        payload = {"data": results, "ai_thought": expanded or q, "served_by": served_by}
+        if served_by not in ("raw_deadline", "pinned") and use_cache:
+            # ผลที่ยังไม่มีคำขยาย ไม่เก็บลง semantic cache (รอบหน้าจะได้ใช้คำขยายที่ AI ตอบตามมา)
+            query_cache.put(raw_vector, q, payload, generation)
+        response = {**payload, "cache": {"hit": False}}
     except Exception as e:
         print(f"❌ Error: {e}")
-        return {"data": [], "error": str(e)}
+        response = {"data": [], "error": str(e)}
+    log_query(q, started, timings, enc, speculative, response)
+    return response
+
+@app.get("/suggest")
+async def suggest(q: str, limit: int = 8):
+    # async: งานเล็กและไม่ block จึงไม่ต้องโยนเข้า threadpool ทุก keystroke
+    t0 = time.perf_counter()
+    data = suggest_index.suggest(q, limit)
+    return {"q": q, "data": data, "took_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+
+@app.get("/related/{product_id}")
+def related_products(product_id: str, k: int = Query(10, ge=1), bundle: bool = False):
+    """สินค้าที่เกี่ยวข้อง (bundle=true = เฉพาะต่างหมวด สำหรับ cross-sell) จากตารางที่คำนวณไว้แล้ว"""
+    table = related_table
+    if table is None:
+        raise HTTPException(status_code=503, detail="Related table not built yet - run 'python related.py'")
+    mode = "bundle" if bundle else "similar"
+    if mode not in table.neighbors:
+        raise HTTPException(status_code=400, detail="Bundle table missing - rebuild with 'python related.py --cross-category'")
+    items = table.lookup(product_id, k, mode)
+    if items is None:
+        raise HTTPException(status_code=404, detail=f"Unknown product id: {product_id}")
+    return {"id": product_id, "mode": mode, "data": items}
+
+
+@app.get("/metrics")
+def metrics():
+    with _expansions_lock:
+        expansions = len(_expansions)
+    return {"semantic_cache": query_cache.metrics(), "ollama": ollama.metrics(), "expansion_cache_size": expansions,
+            "suggest_terms": len(suggest_index),
+            "writer": writer.metrics(), "embedding": encoder.describe(), "query_log": query_logger.metrics()}
+
+
+@app.post("/cache/invalidate")
+def invalidate_cache():
+    on_index_reload("manual")
+    return {"msg": "caches cleared", "semantic_cache": query_cache.metrics()}
+
+
+@app.post("/products", status_code=202)
+def upsert_products(products: Union[ProductIn, List[ProductIn]]):
+    """เพิ่ม/แก้สินค้า (ส่งมาเฉพาะ field ที่เปลี่ยนก็ได้) เข้าคิว writer แล้วตอบกลับทันที"""
+    items = products if isinstance(products, list) else [products]
+    queued = 0
+    for product in items:
+        fields = product.dict(exclude_none=True)
+        if not writer.upsert(fields.pop("id"), fields):
+            raise HTTPException(status_code=429, detail=f"Writer queue full - {queued} of {len(items)} queued")
+        queued += 1
+    return {"queued": queued, "pending": writer.pending}
+
+
+@app.delete("/products/{product_id}", status_code=202)
+def delete_product(product_id: str):
+    if not writer.delete(product_id):
+        raise HTTPException(status_code=429, detail="Writer queue full")
+    return {"queued": 1, "pending": writer.pending}
+
 
-# (ส่วน Setup/Add Product ละไว้ได้ เพราะเรา Import ผ่าน CSV แล้ว)
+# (Import ก้อนใหญ่ยังใช้ ingest.py, แก้รายตัวใช้ /products)
 @app.post("/setup") # ใส่ไว้เผื่อกด Reset จากหน้าเว็บ
 def setup_placeholder():
-    return {"msg": "Please use import_csv.py for bulk data"}
\ No newline at end of file
+    # หลังรัน ingest.py ใหม่ ปุ่มนี้ช่วยล้าง cache ทันทีโดยไม่ต้องรอ index watcher
+    on_index_reload("setup")
+    return {"msg": "Please use ingest.py for bulk data"}
\ No newline at end of file
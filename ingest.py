@@ -0,0 +1,844 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+import numpy as np
+from tqdm import tqdm
+
+# Fix Numpy 2.0
+if not hasattr(np, 'float_'):
+    np.float_ = np.float64
+
+from opensearchpy import OpenSearch
+from sentence_transformers import SentenceTransformer
+
+from text_builder import (DEFAULT_TEXT_MODE, DEFAULT_TOKEN_BUDGET, LEGACY_TEXT, TEXT_MODES, TextBuilder,
+                          compare_encode)
+
+# --- Config กลาง (ทุกสคริปต์ import / api.py ใช้ชุดเดียวกัน) ---
+INDEX_NAME = "ecommerce_products"
+MODEL_NAME = "paraphrase-multilingual-mpnet-base-v2"
+OPENSEARCH_HOSTS = [{'host': 'localhost', 'port': 9200}]
+VECTOR_FIELD = "vector_embedding"   # field ของ embedding version 1 (version ถัดไปเป็น vector_embedding_v2, _v3, ...)
+
+DEFAULT_BATCH_SIZE = 500        # จำนวน doc ต่อ 1 bulk request
+DEFAULT_ENCODE_BATCH_SIZE = 64  # batch ที่ส่งเข้า model.encode ทีละก้อน
+DEFAULT_WORKERS = 2             # จำนวน thread ที่ยิง bulk ขนานกับการ encode
+
+# --- Bulk-load profile: ระหว่างโหลดก้อนใหญ่ไม่ต้อง refresh / ไม่ต้องส่งข้อมูลไป replica ---
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+BULK_LOAD_BATCH_SIZE = 1000     # ~15 MB ต่อ request ที่ 768 มิติ (โหมดปกติใช้ DEFAULT_BATCH_SIZE)
+DEFAULT_REFRESH_INTERVAL = "1s"
+DEFAULT_MAX_SEGMENTS = 1        # force merge ให้เหลือกี่ segment ต่อ shard (HNSW graph น้อย = ค้นเร็ว)
+FINALIZE_TIMEOUT = 1800         # force merge / warmup ของ index ใหญ่ใช้เวลานาน
+
+# ค่า HNSW ของแต่ละโปรไฟล์ ("default" = ค่าเดิมของ OpenSearch)
+INDEX_PROFILES = {
+    "default": {"parameters": {}, "ef_search": None},
+    "fast-build": {"parameters": {"ef_construction": 64, "m": 12}, "ef_search": None},
+    "high-recall": {"parameters": {"ef_construction": 256, "m": 32}, "ef_search": 256},
+}
+
+SOURCE_EXTENSIONS = {".csv": "csv", ".parquet": "parquet", ".jsonl": "snapshot", ".ndjson": "snapshot"}
+DEFAULT_PROFILE_OUT = "ingest_profile.json"
+
+
+def get_client(timeout=60):
+    return OpenSearch(
+        hosts=OPENSEARCH_HOSTS,
+        http_compress=True,
+        use_ssl=False,          # Docker เราปิด Security ไว้
+        verify_certs=False,
+        timeout=timeout
+    )
+
+
+def load_model(name=MODEL_NAME):
+    print(f"⏳ Loading AI Model: {name}...")
+    return SentenceTransformer(name)
+
+
+def wait_for_server(client, attempts=10, delay=2):
+    """วนรอจนกว่า Server จะพร้อม"""
+    print("⏳ Connecting to OpenSearch...", end="", flush=True)
+    for _ in range(attempts):
+        try:
+            if client.ping():
+                print(" ✅ Connected!")
+                return True
+        except Exception:
+            pass
+        print(".", end="", flush=True)
+        time.sleep(delay)
+    print("\n❌ Error: ต่อ Server ไม่ได้เลย (เช็ค Docker หรือยัง?)")
+    return False
+
+
+def vector_mapping(dimension, profile="default"):
+    conf = INDEX_PROFILES[profile]
+    method = {"name": "hnsw", "space_type": "cosinesimil", "engine": "nmslib"}
+    if conf["parameters"]:
+        method["parameters"] = dict(conf["parameters"])
+    return {
+        "type": "knn_vector",
+        "dimension": dimension,  # ใช้ค่าจริงจากโมเดล ไม่ hardcode
+        "method": method
+    }
+
+
+def build_index_body(dimension, profile="default", model_name=MODEL_NAME, text=None):
+    conf = INDEX_PROFILES[profile]
+    index_settings = {"knn": True}
+    if conf["ef_search"]:
+        index_settings["knn.algo_param.ef_search"] = conf["ef_search"]
+
+    return {
+        "settings": {"index": index_settings},
+        "mappings": {
+            # บอกว่า vector ใน index มาจากโมเดลไหน api.py / reembed.py อ่านจากตรงนี้
+            "_meta": {"embedding": {"active": embedding_info(model_name, dimension, text=text)}},
+            "properties": {
+                "title": {"type": "text"},
+                "category": {"type": "keyword"},
+                "price": {"type": "float"},
+                "description": {"type": "text"},
+                "stock": {"type": "integer"},
+                VECTOR_FIELD: vector_mapping(dimension, profile)
+            }
+        }
+    }
+
+
+# --- Embedding metadata: โมเดล / มิติ / field ที่ใช้อยู่ เก็บไว้ใน _meta ของ index ---
+
+def embedding_info(model_name, dimension, field=VECTOR_FIELD, version=1, text=None):
+    # text = วิธีสร้างข้อความก่อน encode (text_builder) ต้องตรงกันทั้งตอน import / live update / query
+    return {"version": version, "model": model_name, "dimension": dimension, "field": field,
+            "text": text or dict(LEGACY_TEXT)}
+
+
+def get_embedding_meta(client, index_name=INDEX_NAME):
+    """คืน {"active": {...}, "pending": {...}} (pending มีเฉพาะตอน reembed.py กำลังเติม field ใหม่)"""
+    mappings = client.indices.get_mapping(index=index_name)[index_name]["mappings"]
+    meta = mappings.get("_meta", {}).get("embedding")
+    if meta:
+        return meta
+    # index ที่สร้างก่อนมี _meta: ทุก importer เดิมใช้ MODEL_NAME กับ field vector_embedding
+    dimension = mappings.get("properties", {}).get(VECTOR_FIELD, {}).get("dimension")
+    return {"active": embedding_info(MODEL_NAME, dimension)}
+
+
+def _put_meta(client, index_name, key, value):
+    # put_mapping แทนที่ _meta ทั้งก้อน ต้องอ่านของเดิมมารวมก่อน (embedding / last_import อยู่ด้วยกัน)
+    mappings = client.indices.get_mapping(index=index_name)[index_name]["mappings"]
+    meta = dict(mappings.get("_meta", {}))
+    meta[key] = value
+    client.indices.put_mapping(index=index_name, body={"_meta": meta})
+
+
+def save_embedding_meta(client, meta, index_name=INDEX_NAME):
+    _put_meta(client, index_name, "embedding", meta)
+
+
+def mark_import(client, stats, index_name=INDEX_NAME):
+    """ประทับเวลา import ลง _meta ให้ api.py รู้ว่าต้อง reload cache (แก้รายตัวผ่าน /products ไม่ถือเป็น import)"""
+    _put_meta(client, index_name, "last_import", {"at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                                  "rows": stats.rows, "failed": stats.failed})
+
+
+def get_last_import(client, index_name=INDEX_NAME):
+    mappings = client.indices.get_mapping(index=index_name)[index_name]["mappings"]
+    return mappings.get("_meta", {}).get("last_import")
+
+
+def prepare_index(client, dimension, profile="default", recreate=True, index_name=INDEX_NAME,
+                  model_name=MODEL_NAME, text=None):
+    """สร้าง index ใหม่ (หรือใช้ของเดิมถ้า append) แล้วคืน embedding ที่ active อยู่"""
+    text = text or dict(LEGACY_TEXT)
+    exists = client.indices.exists(index=index_name)
+    if exists and not recreate:
+        active = get_embedding_meta(client, index_name)["active"]
+        if active["model"] != model_name or active["dimension"] != dimension:
+            raise SystemExit(f"❌ Index ใช้ {active['model']} ({active['dimension']} dim) อยู่ "
+                             f"แต่ตอนนี้ encode ด้วย {model_name} ({dimension} dim) - ใช้ --model ให้ตรงกัน "
+                             f"หรือย้ายโมเดลด้วย reembed.py")
+        if active.get("text", LEGACY_TEXT) != text:
+            raise SystemExit(f"❌ Index สร้างข้อความแบบ {active.get('text', LEGACY_TEXT)} แต่ตอนนี้ใช้ {text} "
+                             f"- ใช้ --text-mode / --token-budget ให้ตรงกัน หรือย้ายด้วย reembed.py")
+        print(f"➕ Appending to existing index: {index_name} (embedding v{active['version']}, field {active['field']})")
+        return active
+    if exists:
+        print(f"🗑️  Resetting Index: {index_name}")
+        client.indices.delete(index=index_name)
+    client.indices.create(index=index_name, body=build_index_body(dimension, profile, model_name, text))
+    print(f"✅ Index created ({profile} profile, {model_name}, dim={dimension}, text {text['mode']})")
+    return embedding_info(model_name, dimension, text=text)
+
+
+def enter_bulk_mode(client, index_name=INDEX_NAME):
+    """สลับ index เป็น bulk-load profile แล้วคืน settings เดิมไว้ใช้ตอน restore"""
+    current = client.indices.get_settings(index=index_name, include_defaults=True)[index_name]
+    explicit = current.get("settings", {}).get("index", {})
+    defaults = current.get("defaults", {}).get("index", {})
+
+    refresh = explicit.get("refresh_interval", defaults.get("refresh_interval", DEFAULT_REFRESH_INTERVAL))
+    if str(refresh) == "-1":
+        # รอบก่อนพังกลางทางแล้วไม่ได้ restore -> อย่าจำค่า -1 เป็นค่า production
+        refresh = DEFAULT_REFRESH_INTERVAL
+    original = {
+        "refresh_interval": refresh,
+        "number_of_replicas": int(explicit.get("number_of_replicas", defaults.get("number_of_replicas", 1))),
+    }
+
+    client.indices.put_settings(index=index_name, body={"index": BULK_LOAD_SETTINGS})
+    print(f"🚚 Bulk-load mode ON (refresh off, 0 replicas) - will restore {original}")
+    return original
+
+
+def restore_settings(client, original, index_name=INDEX_NAME):
+    client.indices.put_settings(index=index_name, body={"index": original})
+    print(f"♻️  Restored production settings: {original}")
+
+
+def warmup_knn(client, index_name=INDEX_NAME):
+    """โหลด HNSW graph เข้า native memory ก่อน query แรกของผู้ใช้จะมาเจอ graph เย็นๆ"""
+    return client.transport.perform_request(
+        "GET", f"/_plugins/_knn/warmup/{index_name}", params={"request_timeout": FINALIZE_TIMEOUT}
+    )
+
+
+def finish_bulk_load(client, original, stats, max_segments=DEFAULT_MAX_SEGMENTS, index_name=INDEX_NAME):
+    """refresh -> ประทับ last_import -> force merge (ถ้าสั่ง) แล้วคืน settings เสมอแม้ขั้นไหนพัง"""
+    # merge ก่อนเปิด replica: replica จะ copy segment ที่ merge แล้ว ไม่ต้อง merge ซ้ำอีกรอบ
+    try:
+        with stats.stage("refresh"):
+            client.indices.refresh(index=index_name, request_timeout=FINALIZE_TIMEOUT)
+        # ข้อมูลค้นเจอแล้ว: ให้ api.py reload cache ได้เลย ไม่ต้องรอ merge (merge พังก็ยังถือว่า import แล้ว)
+        mark_import(client, stats, index_name)
+        if max_segments:
+            with stats.stage("force_merge"):
+                print(f"🧱 Force merging {index_name} down to {max_segments} segment(s)...")
+                client.indices.forcemerge(index=index_name, max_num_segments=max_segments,
+                                          request_timeout=FINALIZE_TIMEOUT)
+    finally:
+        # merge timeout / พัง ก็ต้องคืน refresh / replica ไม่งั้น index ค้าง refresh -1 (writer แก้แล้วค้นไม่เจอ)
+        restore_settings(client, original, index_name)
+
+
+def warm_index(client, stats, index_name=INDEX_NAME):
+    """k-NN warmup แบบ best-effort: ข้อมูลเข้าครบแล้ว warmup ไม่ผ่านแค่ query แรกๆ ช้าหน่อย ไม่ถือว่า import พัง"""
+    try:
+        with stats.stage("knn_warmup"):
+            client.cluster.health(index=index_name, wait_for_status="yellow",
+                                  request_timeout=FINALIZE_TIMEOUT)
+            result = warmup_knn(client, index_name)
+            shards = result.get("_shards", {})
+            print(f"🔥 k-NN warmup done ({shards.get('successful', '?')}/{shards.get('total', '?')} shards)")
+    except Exception as e:
+        print(f"⚠️ k-NN warmup skipped: {e}")
+
+
+# --- Sources: ทุกตัวคืน dict ต่อแถว (id, title, description, category, price) ---
+
+def read_csv(path):
+    with open(path, mode='r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def read_parquet(path, batch_rows=10000):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("❌ อ่าน Parquet ต้องติดตั้ง pyarrow ก่อน (pip install pyarrow)")
+    # อ่านทีละ row group จะได้ไม่ต้องโหลดทั้งไฟล์เข้าแรม
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+        yield from batch.to_pylist()
+
+
+def read_snapshot(path):
+    """Snapshot = JSON Lines ที่มี vector_embedding ติดมาด้วย (ไม่ต้อง encode ใหม่)"""
+    with open(path, mode='r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+SOURCES = {"csv": read_csv, "parquet": read_parquet, "snapshot": read_snapshot}
+
+
+def detect_source(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SOURCE_EXTENSIONS:
+        raise SystemExit(f"❌ ไม่รู้จักชนิดไฟล์ '{ext}' (ระบุ --source เอง: {', '.join(SOURCES)})")
+    return SOURCE_EXTENSIONS[ext]
+
+
+def open_source(path, kind=None):
+    return SOURCES[kind or detect_source(path)](path)
+
+
+def to_source(row):
+    doc = {
+        "title": row['title'],
+        "description": row['description'],
+        "category": row['category'],
+        "price": float(row['price']),
+    }
+    if row.get('stock') not in (None, ''):
+        doc['stock'] = int(row['stock'])
+    return doc
+
+
+def iter_batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def peak_rss_mb():
+    """RSS สูงสุดของ process ตั้งแต่เริ่ม (MB) หรือ None ถ้า OS ไม่มี resource (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux คืนค่าเป็น KB, macOS เป็น byte
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """RSS ตอนนี้ (MB) จาก /proc/self/statm (Linux) หรือ psutil ถ้าติดตั้งไว้ ไม่มีทั้งคู่คืน None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _reset_hwm():
+    """Linux: ตั้ง high-water mark ของ RSS (VmHWM) กลับเป็นค่าปัจจุบัน จะได้วัด peak เฉพาะช่วงถัดไป"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _hwm_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class StagePeak:
+    """RSS สูงสุดระหว่างช่วงหนึ่ง รวม peak ชั่วคราวที่คืนแรมไปก่อนจบขั้น (เช่น activation ของ torch ตอน encode)
+
+    Linux: reset VmHWM ด้วย clear_refs แล้วอ่านตอนจบ (แม่นยำ ไม่มี overhead)
+    OS อื่น: thread สุ่มวัด RSS ทุก interval วินาที (peak ที่สั้นกว่า interval อาจหลุด)
+    """
+
+    def __init__(self, interval=0.01):
+        self.exact = _reset_hwm() and _hwm_mb() is not None
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        if not self.exact and current_rss_mb() is not None:
+            threading.Thread(target=self._sample, name="rss-sampler", daemon=True).start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss_mb()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def reset(self):
+        if self.exact:
+            _reset_hwm()
+        else:
+            self.peak = current_rss_mb()
+
+    def read(self):
+        if self.exact:
+            return _hwm_mb()
+        values = [v for v in (self.peak, current_rss_mb()) if v is not None]
+        return max(values) if values else None
+
+    def stop(self):
+        self._stop.set()
+
+
+class IngestStats:
+    """เก็บเวลาแต่ละขั้น (read / text / encode / tolist / serialize / http) ไว้ทำ throughput report
+
+    profile=True เก็บ CPU time กับ peak RSS ของแต่ละขั้นเพิ่ม (ใช้ตอนจูน ingest ว่าคอขวดอยู่ตรงไหน)
+    """
+
+    # ขั้นที่ทำครั้งเดียว ไม่ได้ทำต่อแถว: rows/s ไม่มีความหมาย
+    ONCE_STAGES = ("model_load", "refresh", "force_merge", "knn_warmup", "text_compare")
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.seconds = {}
+        self.cpu = {}
+        self.rss_peak = {}          # RSS สูงสุดระหว่างขั้นนั้น (ทุกรอบ) รวม peak ชั่วคราวข้างในขั้น
+        self.rss_growth = {}        # RSS ที่ค้างเพิ่มหลังจบขั้นรวมทุกรอบ (ติดลบ = คืนแรม)
+        self.process_peak = peak_rss_mb()   # reset VmHWM ทำให้ ru_maxrss ต่ำลงได้ จึงเก็บ peak รวมเอง
+        self._peak = StagePeak() if profile else None
+        self.rows = 0
+        self.encoded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self.text = None            # TextBuilder.metrics()
+        self.text_compare = None    # compare_encode() ถ้าสั่ง --text-compare
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @contextmanager
+    def stage(self, name):
+        if not self.profile:
+            t0 = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.add(name, time.perf_counter() - t0)
+            return
+
+        # process_time: encode ใช้หลาย thread ของ torch จึงวัดทั้ง process
+        # (ขั้นที่รันคู่กับ bulk thread จะนับ CPU ของ bulk ติดมาด้วย)
+        # peak วัดทั้ง process: bulk thread ที่ยิงอยู่เบื้องหลังกินแรมช่วงนั้นก็นับรวม
+        self._peak.reset()
+        t0, c0, m0 = time.perf_counter(), time.process_time(), current_rss_mb()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0, time.process_time() - c0)
+            m1, peak = current_rss_mb(), self._peak.read()
+            if peak is not None:
+                self.rss_peak[name] = max(self.rss_peak.get(name, 0.0), peak)
+                self.process_peak = max(self.process_peak or 0.0, peak)
+            if m1 is not None and m0 is not None:
+                self.rss_growth[name] = self.rss_growth.get(name, 0.0) + (m1 - m0)
+
+    def add(self, name, seconds, cpu=None):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        if cpu is not None:
+            self.cpu[name] = self.cpu.get(name, 0.0) + cpu
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        if self._peak:
+            self._peak.stop()
+
+    @property
+    def wall(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def report(self, dry_run=False):
+        title = "Dry-run throughput report" if dry_run else "Ingest throughput report"
+        print(f"\n📊 {title}")
+        print(f"   rows        : {self.rows:,} (encoded {self.encoded:,}, skipped {self.skipped:,}, failed {self.failed:,})")
+        if self.profile:
+            print(f"   {'stage':<12}  {'wall s':>8} {'cpu s':>8} {'cpu/wall':>8} {'rows/s':>10} {'peak MB':>8} {'+MB':>7}")
+        for name, sec in self.seconds.items():
+            rate = None if name in self.ONCE_STAGES else (self.rows / sec if sec > 0 else float('inf'))
+            if not self.profile:
+                print(f"   {name:<12}: {sec:8.2f} s" + (f"  ({rate:,.0f} rows/s)" if rate is not None else ""))
+                continue
+            cpu = self.cpu.get(name)
+            cpu_text = f"{cpu:8.2f} {cpu / sec if sec else 0:8.2f}" if cpu is not None else f"{'-':>8} {'-':>8}"
+            rate_text = f"{rate:10,.0f}" if rate is not None else f"{'-':>10}"
+            peak = self.rss_peak.get(name)
+            growth = self.rss_growth.get(name)
+            mem_text = (f"{peak:8.0f}" if peak is not None else f"{'-':>8}") + \
+                       (f" {growth:7.0f}" if growth is not None else f" {'-':>7}")
+            print(f"   {name:<12}: {sec:8.2f} {cpu_text} {rate_text} {mem_text}")
+        wall = self.wall
+        print(f"   {'total wall':<12}: {wall:8.2f} s  ({self.rows / wall if wall else 0:,.0f} rows/s)")
+        if self.bytes_sent:
+            http = self.seconds.get("http", 0)
+            rate = f" ({self.bytes_sent / 1e6 / http:,.1f} MB/s per worker)" if http else ""
+            print(f"   {'bulk body':<12}: {self.bytes_sent / 1e6:8.1f} MB{rate}")
+        if self.profile:
+            if self.process_peak is not None:
+                print(f"   {'process peak':<12}: {self.process_peak:8.0f} MB RSS")
+            how = "VmHWM" if self._peak.exact else f"sampled every {self._peak.interval * 1000:.0f} ms"
+            print("   (serialize / http รวมเวลาของทุก bulk worker จึงเกิน wall ได้ / "
+                  f"peak MB = RSS สูงสุดระหว่างขั้น ({how}), +MB = RSS ที่ค้างเพิ่มหลังจบขั้น)")
+        self.report_text()
+
+    def report_text(self):
+        text = self.text
+        if not text or "avg_tokens" not in text:
+            return
+        print(f"   {'text':<12}: {text['mode']} (budget {text['token_budget'] or '-'}) "
+              f"avg {text['avg_tokens']} tokens/row vs {text['legacy_avg_tokens']} แบบเดิม "
+              f"(-{text['token_reduction']:.0%}, truncated {text['truncated']:,})")
+        encode = self.seconds.get("encode")
+        if encode and text["avg_tokens"]:
+            # ประมาณแบบเส้นตรงตามจำนวน token (วัดจริงด้วย --text-compare)
+            saved = encode * (text["legacy_avg_tokens"] / text["avg_tokens"] - 1)
+            print(f"   {'encode saved':<12}: ~{saved:8.2f} s (est. from token counts)")
+        if self.text_compare:
+            c = self.text_compare
+            print(f"   {'text compare':<12}: {c['rows']:,} rows encode {c['legacy_s']}s -> {c['built_s']}s "
+                  f"(-{c['saved']:.0%} measured)")
+
+    def to_dict(self):
+        stages = {}
+        for name, sec in self.seconds.items():
+            stages[name] = {"wall_s": round(sec, 3)}
+            if name in self.cpu:
+                stages[name]["cpu_s"] = round(self.cpu[name], 3)
+            if name in self.rss_peak:
+                stages[name]["peak_rss_mb"] = round(self.rss_peak[name], 1)
+            if name in self.rss_growth:
+                stages[name]["rss_growth_mb"] = round(self.rss_growth[name], 1)
+        return {"rows": self.rows, "encoded": self.encoded, "skipped": self.skipped, "failed": self.failed,
+                "bulk_bytes": self.bytes_sent, "wall_s": round(self.wall, 3),
+                "text": self.text, "text_compare": self.text_compare,
+                "peak_rss_mb": self.process_peak, "stages": stages}
+
+
+def save_profile(stats, path, settings, sampler_output=None):
+    report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "settings": settings, "sampler_output": sampler_output, **stats.to_dict()}
+    with open(path, mode='w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Profile saved to {path}")
+
+
+def start_sampler():
+    """เปิด sampling profiler ถ้ามี pyinstrument (ไม่มีก็ใช้ cProfile ที่ติดมากับ Python แทน)"""
+    try:
+        from pyinstrument import Profiler
+        profiler = Profiler()
+    except ImportError:
+        import cProfile
+        print("ℹ️ ไม่พบ pyinstrument ใช้ cProfile แทน (pip install pyinstrument จะได้ sampling profile ที่เบากว่า)")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    profiler.start()
+    return profiler
+
+
+def stop_sampler(profiler, base_path):
+    """หยุด profiler แล้วเขียนผลไว้ข้างไฟล์ report คืน path ของไฟล์ผล"""
+    base = os.path.splitext(base_path)[0]
+    if hasattr(profiler, "output_html"):
+        profiler.stop()
+        path = base + ".html"
+        with open(path, mode='w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+        print(profiler.output_text(unicode=True, color=False, show_all=False))
+    else:
+        import pstats
+        profiler.disable()
+        path = base + ".prof"
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    print(f"🔬 Sampler output saved to {path}")
+    return path
+
+
+def _bulk(client, index_name, docs):
+    """ทำ NDJSON เองแล้วค่อยยิง จะได้แยกเวลา serialize (JSON ของ vector) ออกจาก HTTP / OpenSearch"""
+    t0, c0 = time.perf_counter(), time.thread_time()
+    dumps = client.transport.serializer.dumps
+    lines = []
+    for doc_id, doc in docs:
+        lines.append(dumps({"index": {"_index": index_name, "_id": doc_id}}))
+        lines.append(dumps(doc))
+    body = ("\n".join(lines) + "\n").encode("utf-8")
+    t1, c1 = time.perf_counter(), time.thread_time()
+
+    response = client.bulk(body=body)
+    failed = 0
+    if response.get("errors"):
+        failed = sum(1 for item in response["items"] if item.get("index", {}).get("error"))
+    timings = {"serialize": (t1 - t0, c1 - c0), "http": (time.perf_counter() - t1, time.thread_time() - c1)}
+    return failed, timings, len(body)
+
+
+def run_ingest(rows, client=None, model=None, model_name=None, batch_size=None,
+               encode_batch_size=DEFAULT_ENCODE_BATCH_SIZE, workers=DEFAULT_WORKERS,
+               index_profile="default", recreate=True, dry_run=False, snapshot_out=None,
+               total=None, bulk_mode=None, max_segments=None, warmup=None,
+               index_name=INDEX_NAME, profile=False, profile_out=DEFAULT_PROFILE_OUT, sampler=False,
+               text_mode=None, token_budget=None, text_compare=0):
+    """Pipeline เดียวของทุก importer: อ่าน -> encode ทีละ batch -> bulk แบบขนาน
+
+    bulk_mode / max_segments / warmup ที่ไม่ระบุ: เปิดเฉพาะตอนสร้าง index ใหม่
+    append เข้า index ที่ให้บริการอยู่ต้องไม่ปิด refresh / replica (แก้ผ่าน /products จะค้นไม่เจอจนโหลดเสร็จ)
+    และไม่ force merge index ที่ live writer เขียนอยู่ตลอด
+    """
+    stats = IngestStats(profile or sampler)
+    original_settings = None
+    loaded = False
+    vector_field = VECTOR_FIELD
+    fresh = recreate
+
+    if not dry_run:
+        client = client or get_client()
+        if not wait_for_server(client):
+            return None
+        fresh = recreate or not client.indices.exists(index=index_name)
+        if not fresh:
+            # append: ไม่ระบุเองก็ใช้โมเดล / วิธีสร้างข้อความเดียวกับที่ index ใช้อยู่
+            active = get_embedding_meta(client, index_name)["active"]
+            active_text = active.get("text", LEGACY_TEXT)
+            model_name = model_name or active["model"]
+            text_mode = text_mode or active_text["mode"]
+            token_budget = active_text["token_budget"] if token_budget is None else token_budget
+    model_name = model_name or MODEL_NAME
+    bulk_mode = (fresh if bulk_mode is None else bulk_mode) and not dry_run
+    max_segments = (DEFAULT_MAX_SEGMENTS if bulk_mode and fresh else 0) if max_segments is None else max_segments
+    warmup = (fresh if warmup is None else warmup) and not dry_run
+    batch_size = batch_size or (BULK_LOAD_BATCH_SIZE if bulk_mode else DEFAULT_BATCH_SIZE)
+
+    if model is None:
+        with stats.stage("model_load"):
+            model = load_model(model_name)
+    dimension = model.get_sentence_embedding_dimension()
+    builder = TextBuilder.from_config({"mode": text_mode or DEFAULT_TEXT_MODE,
+                                       "token_budget": DEFAULT_TOKEN_BUDGET if token_budget is None else token_budget},
+                                      model)
+    text_config = builder.config()
+    sample = []     # แถวตัวอย่างสำหรับ --text-compare
+
+    if not dry_run:
+        vector_field = prepare_index(client, dimension, index_profile, recreate, index_name, model_name,
+                                     text_config)["field"]
+        if bulk_mode:
+            original_settings = enter_bulk_mode(client, index_name)
+
+    snapshot = open(snapshot_out, mode='w', encoding='utf-8') if snapshot_out else None
+    pool = None if dry_run else ThreadPoolExecutor(max_workers=workers)
+    in_flight = set()
+    profiler = start_sampler() if sampler else None
+    sampler_output = None
+
+    def collect(done):
+        for fut in done:
+            failed, timings, size = fut.result()
+            stats.failed += failed
+            stats.bytes_sent += size
+            for name, (seconds, cpu) in timings.items():
+                stats.add(name, seconds, cpu if stats.profile else None)
+
+    pbar = tqdm(total=total, unit="item")
+    batches = iter_batches(rows, batch_size)
+    try:
+        while True:
+            with stats.stage("read"):
+                batch = next(batches, None)
+            if batch is None:
+                break
+
+            with stats.stage("text"):
+                docs, to_encode, need_vector = [], [], []
+                for row in batch:
+                    try:
+                        doc_id = row['id']
+                        doc = to_source(row)
+                    except (KeyError, TypeError, ValueError) as e:
+                        print(f"⚠️ Skip row {row.get('id')}: {e}")
+                        stats.skipped += 1
+                        continue
+                    vector = row.get('vector_embedding')
+                    # snapshot ที่ไม่มี embedding_model เป็นของเก่าก่อนมี reembed (ใช้ MODEL_NAME ทั้งหมด)
+                    same_model = (row.get('embedding_model', MODEL_NAME) == model_name
+                                  and row.get('embedding_text', LEGACY_TEXT) == text_config)
+                    if vector is not None and len(vector) == dimension and same_model:
+                        doc[vector_field] = vector
+                    else:
+                        need_vector.append(len(docs))
+                        to_encode.append(row)
+                    docs.append((doc_id, doc))
+                texts = builder.build(to_encode) if to_encode else []
+                if len(sample) < text_compare:
+                    sample.extend(to_encode[:text_compare - len(sample)])
+
+            if texts:
+                with stats.stage("encode"):
+                    vectors = model.encode(texts, batch_size=encode_batch_size,
+                                           convert_to_numpy=True, show_progress_bar=False)
+                with stats.stage("tolist"):
+                    for pos, vector in zip(need_vector, vectors.tolist()):
+                        docs[pos][1][vector_field] = vector
+                stats.encoded += len(texts)
+
+            if snapshot:
+                with stats.stage("snapshot"):
+                    for doc_id, doc in docs:
+                        record = {"id": doc_id, **doc, "embedding_model": model_name, "embedding_text": text_config}
+                        record['vector_embedding'] = record.pop(vector_field)
+                        snapshot.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            stats.rows += len(docs)
+            pbar.update(len(batch))
+
+            if dry_run or not docs:
+                continue
+
+            # backpressure: ไม่ให้ batch ค้างในแรมเกิน 2 เท่าของจำนวน worker
+            if len(in_flight) >= workers * 2:
+                with stats.stage("bulk_wait"):
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(pool.submit(_bulk, client, index_name, docs))
+
+        if in_flight:
+            with stats.stage("bulk_wait"):
+                done, _ = wait(in_flight)
+            collect(done)
+            in_flight = set()
+        loaded = True
+    finally:
+        pbar.close()
+        if profiler:
+            sampler_output = stop_sampler(profiler, profile_out)
+        if pool:
+            pool.shutdown(wait=True)
+        if snapshot:
+            snapshot.close()
+        if original_settings and not loaded:
+            # โหลดพังกลางทาง: อย่างน้อยต้องคืน refresh / replica ให้ index ค้นหาได้ตามปกติ
+            restore_settings(client, original_settings, index_name)
+
+    if original_settings:
+        finish_bulk_load(client, original_settings, stats, max_segments, index_name)
+    elif not dry_run:
+        client.indices.refresh(index=index_name)
+        mark_import(client, stats, index_name)
+        if max_segments:
+            with stats.stage("force_merge"):
+                client.indices.forcemerge(index=index_name, max_num_segments=max_segments,
+                                          request_timeout=FINALIZE_TIMEOUT)
+    if warmup:
+        warm_index(client, stats, index_name)
+
+    stats.text = builder.metrics()
+    if sample:
+        with stats.stage("text_compare"):
+            stats.text_compare = compare_encode(model, builder, sample, encode_batch_size)
+    stats.finish()
+    stats.report(dry_run)
+    if stats.profile:
+        settings = {"model": model_name, "text": text_config, "batch_size": batch_size, "encode_batch_size": encode_batch_size,
+                    "workers": workers, "bulk_mode": bulk_mode, "dry_run": dry_run, "index_profile": index_profile}
+        save_profile(stats, profile_out, settings, sampler_output)
+    return stats
+
+
+def count_rows(path):
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in f) - 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="White Rose unified ingestion (CSV / Parquet / snapshot -> OpenSearch)")
+    parser.add_argument("path", help="ไฟล์ข้อมูลสินค้า (.csv, .parquet, .jsonl snapshot)")
+    parser.add_argument("--source", choices=sorted(SOURCES), help="ชนิดไฟล์ (ปกติเดาจากนามสกุล)")
+    parser.add_argument("--batch-size", type=int,
+                        help=f"doc ต่อ bulk request (default {BULK_LOAD_BATCH_SIZE} ในโหมด bulk-load, {DEFAULT_BATCH_SIZE} ถ้าปิด)")
+    parser.add_argument("--encode-batch-size", type=int, default=DEFAULT_ENCODE_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="จำนวน thread ยิง bulk")
+    parser.add_argument("--index-profile", choices=sorted(INDEX_PROFILES), default="default")
+    parser.add_argument("--model", help=f"default {MODEL_NAME} (ถ้า --append ใช้โมเดลเดียวกับที่ index ใช้อยู่)")
+    parser.add_argument("--append", action="store_true", help="เพิ่มเข้า index เดิม ไม่ลบสร้างใหม่")
+    parser.add_argument("--bulk-mode", dest="bulk_mode", action="store_true", default=None,
+                        help="ปิด refresh/replica ระหว่างโหลด (default: เฉพาะตอนสร้าง index ใหม่ ไม่ใช่ --append)")
+    parser.add_argument("--no-bulk-mode", dest="bulk_mode", action="store_false",
+                        help="ไม่ปิด refresh/replica ระหว่างโหลด")
+    parser.add_argument("--max-segments", type=int,
+                        help=f"force merge ให้เหลือกี่ segment หลังโหลดเสร็จ (default {DEFAULT_MAX_SEGMENTS} "
+                             f"ตอนสร้าง index ใหม่, ไม่ merge ตอน --append, 0 = ไม่ merge)")
+    parser.add_argument("--warmup", dest="warmup", action="store_true", default=None,
+                        help="k-NN warmup หลังโหลดเสร็จ (default: เฉพาะตอนสร้าง index ใหม่)")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="ข้าม k-NN warmup หลังโหลดเสร็จ")
+    parser.add_argument("--dry-run", action="store_true", help="อ่าน + encode อย่างเดียว แล้วรายงาน throughput")
+    parser.add_argument("--limit", type=int, help="นำเข้าแค่ N แถวแรก")
+    parser.add_argument("--snapshot-out", help="เขียน snapshot (.jsonl พร้อม vector) ไว้ใช้ reload รอบหน้า")
+    parser.add_argument("--text-mode", choices=TEXT_MODES,
+                        help=f"วิธีสร้างข้อความก่อน encode (default {DEFAULT_TEXT_MODE}, full = ต่อ field ตรงๆ แบบเดิม)")
+    parser.add_argument("--token-budget", type=int,
+                        help=f"จำนวน token สูงสุดต่อสินค้า (default {DEFAULT_TOKEN_BUDGET}, 0 = ไม่จำกัด)")
+    parser.add_argument("--text-compare", type=int, default=0, metavar="N",
+                        help="encode N แถวแรกทั้งแบบเดิมและแบบใหม่ แล้วรายงานเวลาที่ประหยัดได้จริง")
+    parser.add_argument("--profile", action="store_true",
+                        help="วัด wall / CPU / peak RSS ของแต่ละขั้น แล้วบันทึก report เป็น JSON")
+    parser.add_argument("--profile-out", default=DEFAULT_PROFILE_OUT, help="ไฟล์ report ของ --profile")
+    parser.add_argument("--sampler", action="store_true",
+                        help="เปิด sampling profiler (pyinstrument ถ้ามี ไม่งั้น cProfile) ระหว่างโหลด (มี --profile ในตัว)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    kind = args.source or detect_source(args.path)
+
+    if not os.path.exists(args.path):
+        print(f"❌ Error: หาไฟล์ '{args.path}' ไม่เจอ!")
+        return 1
+
+    rows = open_source(args.path, kind)
+    total = count_rows(args.path) if kind == "csv" else None
+    if args.limit:
+        rows = (row for i, row in zip(range(args.limit), rows))
+        total = min(total, args.limit) if total is not None else args.limit
+
+    stats = run_ingest(
+        rows,
+        model_name=args.model,
+        batch_size=args.batch_size,
+        encode_batch_size=args.encode_batch_size,
+        workers=args.workers,
+        index_profile=args.index_profile,
+        recreate=not args.append,
+        dry_run=args.dry_run,
+        snapshot_out=args.snapshot_out,
+        total=total,
+        bulk_mode=args.bulk_mode,
+        max_segments=args.max_segments,
+        warmup=args.warmup,
+        profile=args.profile,
+        profile_out=args.profile_out,
+        sampler=args.sampler,
+        text_mode=args.text_mode,
+        token_budget=args.token_budget,
+        text_compare=args.text_compare,
+    )
+    if stats is None:
+        return 1
+    if not args.dry_run:
+        print("\n🎉 MISSION COMPLETE! ข้อมูลเข้าตู้เรียบร้อยครับ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+import threading
+import time
+
+from opensearchpy import helpers
+
+from ingest import INDEX_NAME, VECTOR_FIELD
+from text_builder import LEGACY_TEXT, TextBuilder
+
+TEXT_FIELDS = ("title", "description", "category")
+DOC_FIELDS = TEXT_FIELDS + ("price", "stock")
+MAX_FLUSH_ATTEMPTS = 5          # flush พังติดกัน (OpenSearch ล่ม) กี่รอบถึงยอมทิ้ง op นั้น
+RETRY_BACKOFF = 0.5             # วินาที, เพิ่มเป็นสองเท่าทุกครั้งที่พังติดกัน
+MAX_RETRY_BACKOFF = 30
+
+
+class BulkWriter:
+    """รับ upsert / delete จาก API แล้วทยอยเขียนลง OpenSearch เป็นก้อนใน thread แยก
+
+    - id เดียวกันที่ถูกแก้ซ้ำระหว่างรอ flush จะถูกรวมเป็นครั้งเดียว (ค่าล่าสุดชนะ)
+    - encode ใหม่เฉพาะสินค้าที่ข้อความเปลี่ยน แก้แค่ราคา/สต็อกใช้ partial update ไม่แตะ vector
+    - flush เมื่อครบ max_batch หรือรอครบ max_wait วินาที อย่างใดอย่างหนึ่งก่อน
+    - ใช้โมเดลคนละ instance กับฝั่ง /search จะได้ไม่ต้องแย่งกันใช้
+    - flush พัง (เช่น OpenSearch สะดุด) op ทั้งก้อนกลับเข้าคิวแล้วลองใหม่แบบ backoff (ตอบ 202 ไปแล้ว ห้ามหาย)
+    """
+
+    def __init__(self, client, model_loader, index_name=INDEX_NAME, max_batch=500, max_wait=1.0,
+                 max_pending=50000, encode_batch_size=32, on_flush=None, vector_field=VECTOR_FIELD,
+                 text_config=None):
+        self.client = client
+        self.model_loader = model_loader
+        self.index_name = index_name
+        self.vector_field = vector_field
+        self.text_config = text_config or dict(LEGACY_TEXT)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.encode_batch_size = encode_batch_size
+        self.on_flush = on_flush
+
+        self._model = None             # (model, TextBuilder) ของ field ปัจจุบัน
+        self._pending = {}            # id -> {"op": "upsert"/"delete", "fields": {...}, "replace": bool}
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self.stats = {"queued": 0, "coalesced": 0, "rejected": 0, "flushes": 0, "indexed": 0,
+                      "updated": 0, "deleted": 0, "errors": 0, "retried": 0, "dropped": 0, "encoded": 0,
+                      "encode_seconds": 0.0, "last_flush_ms": 0.0}
+
+    # --- ฝั่ง API (เรียกจาก request thread) ---
+
+    def _enqueue(self, doc_id, op):
+        with self._cond:
+            current = self._pending.get(doc_id)
+            if current is None and len(self._pending) >= self.max_pending:
+                self.stats["rejected"] += 1
+                return False
+
+            if current is None:
+                self._pending[doc_id] = op
+            else:
+                self._pending[doc_id] = self._combine(current, op)
+                self.stats["coalesced"] += 1
+
+            self.stats["queued"] += 1
+            if self._first_at is None:
+                # รายการแรกของรอบ: ปลุก writer ให้เริ่มนับเวลา max_wait
+                self._first_at = time.monotonic()
+                self._cond.notify()
+            elif len(self._pending) >= self.max_batch:
+                self._cond.notify()
+            return True
+
+    @staticmethod
+    def _combine(older, newer):
+        """รวม op สองตัวของ id เดียวกันให้ผลเหมือนทำทีละตัวตามลำดับ"""
+        if newer["op"] == "delete" or newer.get("replace"):
+            op = dict(newer)
+        elif older["op"] == "delete":
+            # ลบแล้วสร้างใหม่ในรอบเดียวกัน = ต้องเขียนทั้ง doc ไม่ดึงค่าเก่ามาเติม
+            op = {"op": "upsert", "fields": dict(newer["fields"]), "replace": True}
+        else:
+            op = {"op": "upsert", "fields": {**older["fields"], **newer["fields"]}, "replace": older["replace"]}
+        if older.get("attempts"):
+            op["attempts"] = older["attempts"]
+        return op
+
+    def _requeue(self, ops):
+        """op ของ flush ที่พังกลับเข้าคิว (ตัวที่มีค่าใหม่กว่ารออยู่แล้ว เอาค่าใหม่ทับบนค่าที่พัง)"""
+        with self._cond:
+            for doc_id, op in ops.items():
+                attempts = op.get("attempts", 0) + 1
+                if attempts >= MAX_FLUSH_ATTEMPTS:
+                    self.stats["dropped"] += 1
+                    print(f"❌ Bulk writer gave up on {doc_id} after {attempts} attempts")
+                    continue
+                op = dict(op, attempts=attempts)
+                newer = self._pending.get(doc_id)
+                self._pending[doc_id] = op if newer is None else self._combine(op, newer)
+                self.stats["retried"] += 1
+            if self._pending and self._first_at is None:
+                self._first_at = time.monotonic()
+
+    def upsert(self, doc_id, fields):
+        fields = {k: v for k, v in fields.items() if k in DOC_FIELDS and v is not None}
+        return self._enqueue(str(doc_id), {"op": "upsert", "fields": fields, "replace": False})
+
+    def delete(self, doc_id):
+        return self._enqueue(str(doc_id), {"op": "delete"})
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def set_embedding(self, vector_field, text_config):
+        """สลับไปเขียน field ใหม่ (หลัง reembed.py ย้ายโมเดลเสร็จ) โมเดลจะโหลดใหม่ผ่าน model_loader ตอน flush ถัดไป"""
+        with self._cond:
+            self.vector_field = vector_field
+            self.text_config = text_config
+            self._model = None
+
+    def _encoder(self):
+        with self._cond:
+            field, text_config, encoder = self.vector_field, self.text_config, self._model
+        if encoder is None:
+            model = self.model_loader()
+            encoder = (model, TextBuilder.from_config(text_config, model))
+            with self._cond:
+                if self.vector_field == field:
+                    self._model = encoder
+        return field, encoder
+
+    # --- ฝั่ง background thread ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bulk-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=30):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _take(self):
+        with self._cond:
+            while True:
+                if self._pending:
+                    waited = time.monotonic() - self._first_at
+                    if self._stopping or len(self._pending) >= self.max_batch or waited >= self.max_wait:
+                        break
+                    self._cond.wait(self.max_wait - waited)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+            ops, self._pending, self._first_at = self._pending, {}, None
+            return ops
+
+    def _run(self):
+        failures = 0
+        while True:
+            ops = self._take()
+            if ops is None:
+                return
+            try:
+                self.flush(ops)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = min(RETRY_BACKOFF * 2 ** (failures - 1), MAX_RETRY_BACKOFF)
+                print(f"❌ Bulk writer flush failed ({len(ops)} ops): {e} - retrying in {delay:.1f}s")
+                self.stats["errors"] += 1
+                self._requeue(ops)
+                with self._cond:
+                    # ตอน stop ไม่ต้องรอ backoff ครบ ลองรอบสุดท้ายเลย
+                    self._cond.wait_for(lambda: self._stopping, delay)
+
+    def _existing(self, ids):
+        if not ids:
+            return {}
+        res = self.client.mget(index=self.index_name, body={"ids": ids}, _source_includes=list(DOC_FIELDS))
+        return {d['_id']: d.get('_source', {}) for d in res['docs'] if d.get('found')}
+
+    def flush(self, ops):
+        t0 = time.perf_counter()
+        actions, full_docs = [], []
+
+        for doc_id, op in ops.items():
+            if op["op"] == "delete":
+                actions.append({"_op_type": "delete", "_index": self.index_name, "_id": doc_id})
+            elif any(f in op["fields"] for f in TEXT_FIELDS) or op["replace"]:
+                full_docs.append((doc_id, op))
+            else:
+                # แก้แค่ราคา/สต็อก: partial update ไม่ต้อง encode
+                actions.append({"_op_type": "update", "_index": self.index_name, "_id": doc_id,
+                                "doc": op["fields"]})
+
+        # ข้อความเปลี่ยน: เติม field ที่ไม่ได้ส่งมาจาก doc เดิม แล้ว encode ทีเดียวทั้งก้อน
+        # (ดึง doc เดิมของตัวที่ลบด้วย on_flush จะได้รู้ว่า title ไหนหายไปจาก catalog)
+        deleted_ids = [doc_id for doc_id, op in ops.items() if op["op"] == "delete"]
+        existing = self._existing([doc_id for doc_id, op in full_docs] + deleted_ids)
+        sources = []
+        for doc_id, op in full_docs:
+            src = {} if op["replace"] else dict(existing.get(doc_id, {}))
+            src.update(op["fields"])
+            if not src.get("title") or src.get("price") is None:
+                print(f"⚠️ Skip {doc_id}: สินค้าใหม่ต้องมี title และ price")
+                self.stats["errors"] += 1
+                continue
+            src.setdefault("description", "")
+            src.setdefault("category", "")
+            sources.append((doc_id, src))
+
+        if sources:
+            field, (model, builder) = self._encoder()
+            e0 = time.perf_counter()
+            vectors = model.encode(builder.build([src for _, src in sources]),
+                                   batch_size=self.encode_batch_size, convert_to_numpy=True,
+                                   show_progress_bar=False)
+            self.stats["encode_seconds"] += time.perf_counter() - e0
+            self.stats["encoded"] += len(sources)
+            for (doc_id, src), vector in zip(sources, vectors.tolist()):
+                # index ทั้ง doc = field ของโมเดลที่กำลังย้ายไปหายด้วย reembed.py จะเก็บตกให้เอง
+                src[field] = vector
+                actions.append({"_op_type": "index", "_index": self.index_name, "_id": doc_id, "_source": src})
+
+        failed = set()
+        if actions:
+            # raise_on_exception=True: OpenSearch ต่อไม่ได้ทั้งก้อน -> exception -> _run เอาทั้ง batch กลับเข้าคิว
+            ok, errors = helpers.bulk(self.client, actions, chunk_size=len(actions), raise_on_error=False,
+                                      raise_on_exception=True)
+            failed = self._item_failures(errors, ops)
+
+        written = [a for a in actions if a["_id"] not in failed]
+        sources = [(doc_id, src) for doc_id, src in sources if doc_id not in failed]
+        self.stats["flushes"] += 1
+        self.stats["indexed"] += len(sources)
+        self.stats["updated"] += sum(1 for a in written if a["_op_type"] == "update")
+        self.stats["deleted"] += sum(1 for a in written if a["_op_type"] == "delete")
+        self.stats["last_flush_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        if self.on_flush:
+            # แจ้งเฉพาะตัวที่เขียนลงจริง (ตัวที่พัง / รอ retry ยังไม่เปลี่ยนใน index)
+            # previous = ค่าก่อนแก้ของสินค้าที่ข้อความเปลี่ยน / ถูกลบ (สินค้าใหม่จะไม่มีใน previous)
+            written_ids = {a["_id"] for a in written}
+            replaced = {doc_id: existing[doc_id] for doc_id, _ in full_docs
+                        if doc_id in existing and doc_id in written_ids}
+            replaced.update((doc_id, existing[doc_id]) for doc_id in deleted_ids
+                            if doc_id in existing and doc_id in written_ids)
+            self.on_flush(written_ids, dict(sources), replaced)
+
+    def _item_failures(self, errors, ops):
+        """id ที่ bulk ไม่สำเร็จ: 429 / 5xx กลับเข้าคิวไปลองใหม่ ที่เหลือ (เช่น 400 mapping ผิด) นับเป็น error"""
+        failed, retry = set(), {}
+        for err in errors:
+            op_type, item = next(iter(err.items()))
+            doc_id, status = str(item.get("_id")), item.get("status", 500)
+            if op_type == "delete" and status == 404:
+                continue    # ลบของที่ไม่มีอยู่แล้ว = ได้ผลเหมือนลบสำเร็จ
+            failed.add(doc_id)
+            if status == 429 or status >= 500:
+                retry[doc_id] = ops[doc_id]
+            else:
+                self.stats["errors"] += 1
+                print(f"⚠️ Bulk writer item failed: {err}")
+        if retry:
+            print(f"⚠️ Bulk writer: {len(retry)} item(s) rejected (429/5xx) - re-queued")
+            self._requeue(retry)
+        return failed
+
+    def metrics(self):
+        with self._cond:
+            return {**self.stats, "pending": len(self._pending),
+                    "encode_seconds": round(self.stats["encode_seconds"], 3)}
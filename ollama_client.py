@@ -0,0 +1,175 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_MODEL = "llama3.2"
+
+
+class CircuitBreaker:
+    """ตัดวงจรเมื่อ Ollama ล่ม/ช้าติดกันหลายครั้ง จะได้ไม่ต้องรอ timeout ทุก request
+
+    closed    -> เรียกได้ตามปกติ
+    open      -> ข้ามการเรียกทั้งหมดจนครบ reset_timeout
+    half_open -> ปล่อย probe ไป 1 ตัว ถ้าผ่านกลับเป็น closed ถ้าไม่ผ่านกลับไป open
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold=3, slow_threshold=2.0, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.slow_threshold = slow_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def cancel(self):
+        """ได้สิทธิ์ยิงแล้วแต่ไม่ได้ยิงจริง (เช่นเวลาหมดระหว่างรอคิว) -> คืน probe โดยไม่นับเป็น failure"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self, elapsed):
+        if elapsed > self.slow_threshold:
+            # ตอบได้แต่ช้าเกิน ก็นับว่าไม่พร้อมใช้งาน
+            self.record_failure()
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "state_code": self.STATE_CODES[self.state],
+                "consecutive_failures": self.consecutive_failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+class OllamaClient:
+    """Client ของ Ollama ที่ใช้ connection pool เดียวตลอดอายุ process
+
+    - จำกัดจำนวน request ที่ยิงพร้อมกัน (Ollama รันโมเดลทีละไม่กี่ตัว ยิงเยอะไปก็ต่อคิวอยู่ดี)
+    - timeout คิดจาก deadline ของแต่ละ request ไม่ใช่ค่าคงที่
+    - คืน None เมื่อไม่ได้คำตอบ ให้ผู้เรียกตัดสินใจ fallback เอง
+    """
+
+    def __init__(self, base_url=OLLAMA_URL, model=OLLAMA_MODEL, max_concurrency=4,
+                 max_timeout=5.0, min_timeout=0.3, breaker=None):
+        self.url = f"{base_url.rstrip('/')}/api/generate"
+        self.model = model
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "success": 0, "errors": 0, "timeouts": 0,
+                         "rejected_breaker": 0, "rejected_busy": 0, "skipped_budget": 0}
+        self.total_latency = 0.0
+
+    def _count(self, name, latency=None):
+        with self._lock:
+            self.counters[name] += 1
+            if latency is not None:
+                self.total_latency += latency
+
+    def _timeout(self, deadline):
+        if deadline is None:
+            return self.max_timeout
+        remaining = deadline - time.monotonic()
+        if remaining < self.min_timeout:
+            return None
+        return min(self.max_timeout, remaining)
+
+    def generate(self, prompt, deadline=None):
+        timeout = self._timeout(deadline)
+        if timeout is None:
+            self._count("skipped_budget")
+            return None
+
+        # รอคิวได้ไม่เกินเวลาที่เหลือ ถ้าเต็มนานก็ข้ามไปเลย
+        if not self._slots.acquire(timeout=max(0.0, timeout - self.min_timeout)):
+            self._count("rejected_busy")
+            return None
+        try:
+            if not self.breaker.allow():
+                self._count("rejected_breaker")
+                return None
+
+            timeout = self._timeout(deadline)
+            if timeout is None:
+                # เวลาหมดระหว่างรอคิว: ไม่ได้ยิงจริง คืน probe ให้ breaker ด้วย
+                self.breaker.cancel()
+                self._count("skipped_budget")
+                return None
+
+            self._count("requests")
+            t0 = time.monotonic()
+            try:
+                payload = {"model": self.model, "prompt": prompt, "stream": False}
+                res = self.session.post(self.url, json=payload, timeout=(min(1.0, timeout), timeout))
+                res.raise_for_status()
+                text = res.json()['response'].strip()
+            except requests.Timeout:
+                self.breaker.record_failure()
+                self._count("timeouts", time.monotonic() - t0)
+                return None
+            except Exception as e:
+                # รวม body ผิดรูป ({"response": null}, JSON ที่ไม่ใช่ dict) ทุกกรณีต้อง record_failure
+                # ไม่งั้น probe ของ half_open ไม่ถูกคืน breaker จะค้าง half_open ปฏิเสธทุก call ไปตลอด
+                print(f"⚠️ Ollama error: {e!r}")
+                self.breaker.record_failure()
+                self._count("errors", time.monotonic() - t0)
+                return None
+
+            elapsed = time.monotonic() - t0
+            self.breaker.record_success(elapsed)
+            self._count("success", elapsed)
+            return text or None
+        finally:
+            self._slots.release()
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self.counters)
+            called = counters["success"] + counters["errors"] + counters["timeouts"]
+            avg = self.total_latency / called if called else 0.0
+        return {**counters, "avg_latency_ms": round(avg * 1000, 1), "breaker": self.breaker.metrics()}
@@ -0,0 +1,122 @@
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from contextlib import contextmanager
+
+DEFAULT_LOG_DIR = "query_logs"
+DEFAULT_SAMPLE_RATE = 0.1       # เก็บ 10% ของ request (1.0 = ทุกตัว, 0 = ปิด)
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 10
+QUEUE_SIZE = 10000              # entry ที่รอเขียนได้สูงสุด เกินนี้ทิ้ง (ไม่ให้ดิสก์ช้าแล้วลาม /search)
+LOG_FILE = "queries.jsonl"
+
+
+@contextmanager
+def stage(timings, name):
+    """จับเวลาเป็นมิลลิวินาทีลง timings[name] (เรียกซ้ำชื่อเดิมจะบวกสะสม)"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(timings.get(name, 0.0) + (time.perf_counter() - t0) * 1000, 2)
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, ensure_ascii=False)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue, owner):
+        super().__init__(log_queue)
+        self.owner = owner
+
+    def prepare(self, record):
+        # ไม่ format ใน request thread: แปลงเป็น JSON ตอนเขียนไฟล์ใน thread ของ listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.owner.dropped += 1
+
+
+class QueryLogger:
+    """บันทึก query จริงของผู้ใช้เป็น JSON Lines (สุ่มเก็บตาม sample_rate) ไว้ replay ทดสอบ build ใหม่
+
+    request thread แค่สุ่ม + โยน dict เข้าคิว ส่วนแปลง JSON / เขียนไฟล์ / หมุนไฟล์ทำใน QueueListener
+    """
+
+    def __init__(self, directory=DEFAULT_LOG_DIR, sample_rate=DEFAULT_SAMPLE_RATE, max_bytes=DEFAULT_MAX_BYTES,
+                 backup_count=DEFAULT_BACKUP_COUNT, queue_size=QUEUE_SIZE):
+        self.directory = directory
+        self.path = os.path.join(directory, LOG_FILE)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.logged = 0
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._file_handler = None
+        self._listener = None
+        self._logger = logging.getLogger("white_rose.query_log")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.handlers = [_DroppingQueueHandler(self._queue, self)]
+
+    @property
+    def enabled(self):
+        return self._listener is not None
+
+    def start(self):
+        if self.sample_rate <= 0 or self._listener is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._file_handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8")
+        self._file_handler.setFormatter(_JsonFormatter())
+        self._listener = logging.handlers.QueueListener(self._queue, self._file_handler)
+        self._listener.start()
+        print(f"📝 Query log: {self.path} (sample {self.sample_rate:.0%})")
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()   # เขียนที่ค้างในคิวให้หมดก่อน
+            self._file_handler.close()
+            self._listener = None
+
+    def log(self, entry):
+        if self._listener is None or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return False
+        self._logger.info(entry)
+        self.logged += 1
+        return True
+
+    def metrics(self):
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "logged": self.logged,
+                "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+def log_files(paths):
+    """รับไฟล์ / โฟลเดอร์ / glob แล้วคืนไฟล์ log ทั้งหมด (รวมไฟล์ที่หมุนแล้ว queries.jsonl.1, .2, ...)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, LOG_FILE + "*")))
+        else:
+            files.extend(glob.glob(path) or [path])
+    return sorted(set(files))
+
+
+def read_entries(paths):
+    entries = []
+    for path in log_files(paths):
+        with open(path, encoding="utf-8") as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    return sorted(entries, key=lambda entry: entry["ts"])
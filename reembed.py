@@ -0,0 +1,213 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+# Fix Numpy 2.0
+if not hasattr(np, 'float_'):
+    np.float_ = np.float64
+
+from opensearchpy import helpers
+
+from ingest import (INDEX_NAME, INDEX_PROFILES, VECTOR_FIELD, embedding_info, get_client, get_embedding_meta,
+                    iter_batches, load_model, save_embedding_meta, vector_mapping, wait_for_server)
+from text_builder import DEFAULT_TEXT_MODE, DEFAULT_TOKEN_BUDGET, LEGACY_TEXT, TEXT_MODES, TextBuilder
+
+# --- Config ---
+DEFAULT_BATCH_SIZE = 256        # doc ต่อรอบ (scan -> encode -> bulk update)
+DEFAULT_ENCODE_BATCH_SIZE = 64
+DEFAULT_MAX_RATE = 200          # doc/วินาที สูงสุด กันไม่ให้ cluster หนักจน /search ช้า (0 = ไม่จำกัด)
+DEFAULT_SETTLE = 120            # วินาทีที่รอให้ api.py สลับโมเดลก่อนเก็บตกรอบสุดท้าย
+MAX_PASSES = 5                  # รอบเก็บตก doc ที่ถูกแก้ระหว่างย้าย (writer เขียนทับ = field ใหม่หาย)
+TEXT_FIELDS = ("title", "description", "category")
+
+
+def field_for(version):
+    return VECTOR_FIELD if version == 1 else f"{VECTOR_FIELD}_v{version}"
+
+
+def missing_query(field):
+    return {"bool": {"must_not": {"exists": {"field": field}}}}
+
+
+def missing_count(client, field, index_name=INDEX_NAME):
+    client.indices.refresh(index=index_name)
+    return client.count(index=index_name, body={"query": missing_query(field)})["count"]
+
+
+def start_migration(client, meta, model_name, dimension, text, profile="default", index_name=INDEX_NAME):
+    """เพิ่ม field ใหม่เข้า mapping แล้วจด pending ไว้ใน _meta (รันซ้ำ = ทำต่อจากที่ค้างไว้)"""
+    pending = meta.get("pending")
+    if pending:
+        if pending["model"] != model_name or pending.get("text", LEGACY_TEXT) != text:
+            raise SystemExit(f"❌ มีการย้ายไป {pending['model']} ({pending.get('text', LEGACY_TEXT)}) ค้างอยู่ "
+                             f"- ใช้ --abort ก่อนถ้าจะเปลี่ยนโมเดล / วิธีสร้างข้อความ")
+        print(f"↩️  Resuming migration to v{pending['version']} ({pending['model']} -> '{pending['field']}')")
+        return pending
+
+    # field ที่เคย abort ไปแล้วยังอยู่ใน mapping (ลบ mapping ไม่ได้) จึงต้องขยับ version ข้ามไป
+    version = max(meta["active"]["version"] + 1, meta.get("next_version", 0))
+    pending = embedding_info(model_name, dimension, field_for(version), version, text)
+    client.indices.put_mapping(index=index_name,
+                               body={"properties": {pending["field"]: vector_mapping(dimension, profile)}})
+    meta["pending"] = pending
+    save_embedding_meta(client, meta, index_name)
+    print(f"🆕 Added field '{pending['field']}' ({dimension} dim) for embedding v{version}")
+    return pending
+
+
+def fill(client, model, builder, field, index_name=INDEX_NAME, batch_size=DEFAULT_BATCH_SIZE,
+         encode_batch_size=DEFAULT_ENCODE_BATCH_SIZE, max_rate=DEFAULT_MAX_RATE):
+    """encode doc ที่ยังไม่มี field ใหม่ แล้ว partial update ทีละก้อน (ไม่แตะ field ที่ /search ใช้อยู่)"""
+    total = missing_count(client, field, index_name)
+    if not total:
+        return 0, 0
+
+    query = {"_source": list(TEXT_FIELDS), "seq_no_primary_term": True, "query": missing_query(field)}
+    hits = helpers.scan(client, index=index_name, query=query, size=batch_size)
+    done = failed = 0
+    t0 = time.perf_counter()
+    pbar = tqdm(total=total, unit="item", desc=field)
+    try:
+        for batch in iter_batches(hits, batch_size):
+            texts = builder.build([{"title": "", "description": "", "category": "", **hit['_source']} for hit in batch])
+            vectors = model.encode(texts, batch_size=encode_batch_size, convert_to_numpy=True,
+                                   show_progress_bar=False)
+            # if_seq_no: ถ้า writer แก้สินค้านี้หลังจากเราอ่าน ให้ update นี้ fail ไปเลย
+            # (ไม่งั้นจะได้ vector ของข้อความเก่า) รอบเก็บตกจะ encode จากข้อความใหม่ให้
+            actions = [{"_op_type": "update", "_index": index_name, "_id": hit['_id'],
+                        "if_seq_no": hit['_seq_no'], "if_primary_term": hit['_primary_term'],
+                        "doc": {field: vector}}
+                       for hit, vector in zip(batch, vectors.tolist())]
+            ok, errors = helpers.bulk(client, actions, chunk_size=len(actions), raise_on_error=False,
+                                      raise_on_exception=False)
+            done += len(batch)
+            failed += len(errors)
+            pbar.update(len(batch))
+
+            if max_rate:
+                ahead = done / max_rate - (time.perf_counter() - t0)
+                if ahead > 0:
+                    time.sleep(ahead)
+    finally:
+        pbar.close()
+    return done, failed
+
+
+def fill_until_complete(client, model, builder, field, args):
+    for attempt in range(1, MAX_PASSES + 1):
+        done, failed = fill(client, model, builder, field, args.index, args.batch_size, args.encode_batch_size,
+                            args.max_rate)
+        remaining = missing_count(client, field, args.index)
+        print(f"   pass {attempt}: encoded {done:,} (conflict/failed {failed:,}), still missing {remaining:,}")
+        if not remaining:
+            return True
+    return False
+
+
+def drop_field(client, field, index_name=INDEX_NAME, max_rate=DEFAULT_MAX_RATE):
+    """ลบ vector ของ field ที่เลิกใช้ออกจาก _source (mapping ยังอยู่ แต่ไม่กินที่ใน HNSW graph แล้ว)"""
+    body = {"script": {"source": "ctx._source.remove(params.field)", "params": {"field": field}},
+            "query": {"exists": {"field": field}}}
+    task = client.update_by_query(index=index_name, body=body, conflicts="proceed",
+                                  requests_per_second=max_rate or -1, wait_for_completion=False)
+    print(f"🧹 Dropping '{field}' in background (task {task.get('task')})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-embed the catalog with a new model without downtime")
+    parser.add_argument("--model", help="โมเดลที่จะย้ายไป (ไม่ระบุ = โมเดลเดิม ใช้ตอนเปลี่ยนแค่ --text-mode / --token-budget)")
+    parser.add_argument("--text-mode", choices=TEXT_MODES, default=DEFAULT_TEXT_MODE)
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--index", default=INDEX_NAME)
+    parser.add_argument("--index-profile", choices=sorted(INDEX_PROFILES), default="default",
+                        help="ค่า HNSW ของ field ใหม่")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--encode-batch-size", type=int, default=DEFAULT_ENCODE_BATCH_SIZE)
+    parser.add_argument("--max-rate", type=int, default=DEFAULT_MAX_RATE, help="doc/วินาที สูงสุด (0 = ไม่จำกัด)")
+    parser.add_argument("--no-switch", action="store_true", help="เติม field ใหม่อย่างเดียว ยังไม่สลับให้ api.py ใช้")
+    parser.add_argument("--settle", type=int, default=DEFAULT_SETTLE,
+                        help="วินาทีที่รอ api.py สลับโมเดลก่อนเก็บตกรอบสุดท้าย")
+    parser.add_argument("--status", action="store_true", help="แสดง embedding metadata ของ index แล้วจบ")
+    parser.add_argument("--abort", action="store_true", help="ยกเลิกการย้ายที่ค้างอยู่")
+    parser.add_argument("--drop-old", action="store_true", help="ลบ vector ของโมเดลก่อนหน้า (หลัง api.py สลับแล้ว)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    client = get_client()
+    if not wait_for_server(client):
+        return 1
+    meta = get_embedding_meta(client, args.index)
+
+    if args.status:
+        print(json.dumps(meta, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.abort:
+        pending = meta.pop("pending", None)
+        if not pending:
+            print("ℹ️ ไม่มีการย้ายค้างอยู่")
+            return 0
+        meta["next_version"] = pending["version"] + 1
+        save_embedding_meta(client, meta, args.index)
+        drop_field(client, pending["field"], args.index, args.max_rate)
+        print(f"🛑 Aborted migration to v{pending['version']} ({pending['model']})")
+        return 0
+
+    if args.drop_old:
+        previous = meta.get("previous")
+        if not previous:
+            print("ℹ️ ไม่มี embedding เก่าให้ลบ")
+            return 0
+        drop_field(client, previous["field"], args.index, args.max_rate)
+        meta.pop("previous")
+        save_embedding_meta(client, meta, args.index)
+        return 0
+
+    active = meta["active"]
+    model_name = args.model or active["model"]
+    model = load_model(model_name)
+    builder = TextBuilder.from_config({"mode": args.text_mode, "token_budget": args.token_budget}, model)
+    text = builder.config()
+    if active["model"] == model_name and active.get("text", LEGACY_TEXT) == text and not meta.get("pending"):
+        print(f"✅ Index ใช้ {model_name} {text} อยู่แล้ว (v{active['version']}, field '{active['field']}')")
+        return 0
+
+    pending = start_migration(client, meta, model_name, model.get_sentence_embedding_dimension(), text,
+                              args.index_profile, args.index)
+
+    t0 = time.perf_counter()
+    print(f"🔄 Re-embedding into '{pending['field']}' (≤ {args.max_rate or '∞'} doc/s) "
+          f"- /search ยังใช้ '{active['field']}' ตามปกติ")
+    if not fill_until_complete(client, model, builder, pending["field"], args):
+        print(f"❌ ยังมี doc ที่ไม่มี '{pending['field']}' หลัง {MAX_PASSES} รอบ (มีการแก้สินค้าถี่มาก?) "
+              f"- รันคำสั่งเดิมซ้ำเพื่อทำต่อ")
+        return 1
+
+    if args.no_switch:
+        print(f"⏸️  '{pending['field']}' ครบแล้ว - รันคำสั่งเดิมอีกครั้งโดยไม่ใส่ --no-switch เพื่อสลับ")
+        return 0
+
+    # สลับ: api.py เห็น active ใหม่ใน _meta แล้วโหลดโมเดลใหม่ + ค้นจาก field ใหม่พร้อมกัน
+    meta = get_embedding_meta(client, args.index)
+    meta = {"active": pending, "previous": meta["active"], "next_version": pending["version"] + 1}
+    save_embedding_meta(client, meta, args.index)
+    print(f"🔀 Switched index to embedding v{pending['version']} ({pending['model']}) in "
+          f"{time.perf_counter() - t0:.1f}s")
+
+    # ระหว่างที่ api.py ยังโหลดโมเดลใหม่ไม่เสร็จ writer อาจเขียนสินค้าด้วยโมเดลเก่า -> รอแล้วเก็บตก
+    if args.settle:
+        print(f"⏳ Waiting {args.settle}s for api.py to pick up the new model, then a final catch-up pass...")
+        time.sleep(args.settle)
+        fill_until_complete(client, model, builder, pending["field"], args)
+    print(f"🎉 Done. ลบ vector เก่าได้ด้วย 'python reembed.py --drop-old' เมื่อ /metrics แสดง version {pending['version']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
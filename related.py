@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+# Fix Numpy 2.0
+if not hasattr(np, 'float_'):
+    np.float_ = np.float64
+
+# --- Config ---
+RELATED_DIR = "related_table"   # ตาราง neighbor (ไฟล์ .npy แยกตาม array เปิดแบบ mmap ได้)
+BUILD_PREFIX = "build-"         # แต่ละรอบเขียนลงโฟลเดอร์ย่อยใหม่ ไม่เขียนทับไฟล์ที่ api.py mmap อยู่
+_BUILD_DIR = re.compile(re.escape(BUILD_PREFIX) + r"\d{8}-\d{6}-\w{8}$")   # ชื่อที่ save_table ตั้ง (mkdtemp)
+DEFAULT_TOP_N = 20
+ROW_BLOCK = 1024                # จำนวนสินค้าที่คำนวณพร้อมกันต่อรอบ
+COL_BLOCK = 8192                # จำนวนสินค้าที่เทียบต่อ 1 matmul (คุมขนาด matrix ชั่วคราวในแรม)
+
+
+# --- 1. ดึง embedding ออกมาเป็นไฟล์ mmap (ไม่ต้องโหลดทั้งก้อนเข้าแรม) ---
+
+def _iter_index(client, index_name):
+    from opensearchpy import helpers
+    from ingest import get_embedding_meta
+    # ใช้ field ของ embedding ที่ active อยู่ (หลังย้ายโมเดลด้วย reembed.py จะไม่ใช่ vector_embedding แล้ว)
+    field = get_embedding_meta(client, index_name)["active"]["field"]
+    query = {"_source": ["title", "category", "price", field], "query": {"match_all": {}}}
+    for hit in helpers.scan(client, index=index_name, query=query, size=1000):
+        src = hit['_source']
+        src['vector_embedding'] = src.pop(field, None)
+        yield hit['_id'], src
+
+
+def _iter_snapshot(path):
+    with open(path, mode='r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                doc = json.loads(line)
+                yield doc['id'], doc
+
+
+def export_vectors(workdir, snapshot=None):
+    """เขียน vector ทั้งหมดลง vectors.f32 (memmap) พร้อม metadata ของแต่ละแถว"""
+    if snapshot:
+        with open(snapshot, encoding='utf-8') as f:
+            total = sum(1 for line in f if line.strip())
+        docs = _iter_snapshot(snapshot)
+    else:
+        from ingest import INDEX_NAME, get_client
+        client = get_client()
+        total = client.count(index=INDEX_NAME)["count"]
+        docs = _iter_index(client, INDEX_NAME)
+
+    ids, titles, categories, prices = [], [], [], []
+    vectors = None
+    row = 0
+    for doc_id, src in tqdm(docs, total=total, unit="item", desc="export"):
+        vector = src.get('vector_embedding')
+        if not vector or row >= total:
+            continue
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(os.path.join(workdir, "vectors.npy"), mode='w+',
+                                                dtype=np.float32, shape=(total, len(vector)))
+        vectors[row] = vector
+        ids.append(str(doc_id))
+        titles.append(src.get('title') or "")
+        categories.append(src.get('category') or "")
+        prices.append(float(src.get('price') or 0))
+        row += 1
+
+    if vectors is None:
+        raise SystemExit("❌ ไม่พบ vector เลย (import ข้อมูลแล้วหรือยัง?)")
+    vectors.flush()
+    return vectors[:row], ids, titles, categories, prices
+
+
+def _normalize_inplace(vectors, block=ROW_BLOCK * 8):
+    for start in range(0, len(vectors), block):
+        chunk = vectors[start:start + block]
+        norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors[start:start + block] = chunk / norms
+
+
+# --- 2. Top-N cosine neighbors แบบ blockwise ---
+
+def _merge_topk(best_idx, best_sim, cand_idx, cand_sim, k):
+    idx = np.concatenate([best_idx, cand_idx], axis=1)
+    sim = np.concatenate([best_sim, cand_sim], axis=1)
+    part = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(idx, part, axis=1), np.take_along_axis(sim, part, axis=1)
+
+
+def _block_topk(sims, col_start, k):
+    if sims.shape[1] <= k:
+        idx = np.broadcast_to(np.arange(sims.shape[1]) + col_start, sims.shape)
+        return np.ascontiguousarray(idx), sims
+    part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    return part + col_start, np.take_along_axis(sims, part, axis=1)
+
+
+def top_neighbors(vectors, category_codes, k=DEFAULT_TOP_N, cross_category=False,
+                  row_block=ROW_BLOCK, col_block=COL_BLOCK):
+    """คืน (neighbors, scores) ขนาด N x k ของทั้ง "สินค้าคล้ายกัน" และ (ถ้าขอ) "ต่างหมวดสำหรับจัดชุด" """
+    n = len(vectors)
+    k = min(k, n - 1) if n > 1 else 1
+    modes = ["similar", "bundle"] if cross_category else ["similar"]
+    out = {mode: (np.full((n, k), -1, dtype=np.int32), np.zeros((n, k), dtype=np.float16)) for mode in modes}
+
+    for rs in tqdm(range(0, n, row_block), unit="block", desc="neighbors"):
+        re_ = min(rs + row_block, n)
+        rows = np.asarray(vectors[rs:re_])
+        row_ids = np.arange(rs, re_)
+        best = {mode: (np.full((re_ - rs, k), -1, dtype=np.int64),
+                       np.full((re_ - rs, k), -np.inf, dtype=np.float32)) for mode in modes}
+
+        for cs in range(0, n, col_block):
+            ce = min(cs + col_block, n)
+            sims = rows @ np.asarray(vectors[cs:ce]).T
+
+            # ตัดตัวเองทิ้ง
+            overlap = (row_ids >= cs) & (row_ids < ce)
+            sims[np.flatnonzero(overlap), row_ids[overlap] - cs] = -np.inf
+
+            cand = _block_topk(sims, cs, k)
+            best["similar"] = _merge_topk(*best["similar"], *cand, k)
+
+            if cross_category:
+                same = category_codes[rs:re_, None] == category_codes[None, cs:ce]
+                sims[same] = -np.inf
+                cand = _block_topk(sims, cs, k)
+                best["bundle"] = _merge_topk(*best["bundle"], *cand, k)
+
+        for mode in modes:
+            idx, sim = best[mode]
+            order = np.argsort(-sim, axis=1)
+            idx = np.take_along_axis(idx, order, axis=1)
+            sim = np.take_along_axis(sim, order, axis=1)
+            idx[~np.isfinite(sim)] = -1
+            out[mode][0][rs:re_] = idx
+            out[mode][1][rs:re_] = np.where(np.isfinite(sim), sim, 0)
+    return out
+
+
+# --- 3. ตารางสำหรับ api.py: lookup O(1) ไม่ต้องเรียกโมเดล / OpenSearch ---
+
+class RelatedTable:
+    def __init__(self, path, ids, titles, categories, prices, neighbors, meta):
+        self.path = path
+        self.ids = ids
+        self.titles = titles
+        self.categories = categories
+        self.prices = prices
+        self.neighbors = neighbors   # {"similar": (idx, scores), "bundle": (idx, scores)}
+        self.meta = meta
+        self.row_of = {doc_id: row for row, doc_id in enumerate(ids.tolist())}
+
+    @classmethod
+    def load(cls, path=RELATED_DIR):
+        def arr(name):
+            return np.load(os.path.join(path, meta["dir"], f"{name}.npy"), mmap_mode='r')
+
+        # meta.json ชี้ไปโฟลเดอร์ build-* ของรอบล่าสุด
+        with open(os.path.join(path, "meta.json"), encoding='utf-8') as f:
+            meta = json.load(f)
+        neighbors = {mode: (arr(f"{mode}_idx"), arr(f"{mode}_scores")) for mode in meta["modes"]}
+        return cls(path, arr("ids"), arr("titles"), arr("categories"), arr("prices"), neighbors, meta)
+
+    def lookup(self, product_id, k=10, mode="similar"):
+        row = self.row_of.get(str(product_id))
+        if row is None or mode not in self.neighbors:
+            return None
+        idx, scores = self.neighbors[mode]
+        items = []
+        for j, score in zip(idx[row, :k].tolist(), scores[row, :k].tolist()):
+            if j < 0:
+                break
+            items.append({
+                "id": str(self.ids[j]),
+                "title": str(self.titles[j]),
+                "category": str(self.categories[j]),
+                "price": float(self.prices[j]),
+                "score": round(score, 4),
+            })
+        return items
+
+
+def save_table(path, ids, titles, categories, prices, neighbors, k, source):
+    """เขียนตารางชุดใหม่ลงโฟลเดอร์ build-* ใหม่ แล้วค่อยสลับ meta.json ไปชี้ (api.py ที่ mmap ชุดเก่าอยู่ไม่พัง)
+
+    np.save ทับไฟล์เดิมจะ truncate ไฟล์ที่ถูก mmap อยู่ -> process ที่อ่านตายด้วย SIGBUS
+    หรืออ่านได้ข้อมูลชุดใหม่ปนกับ row_of ชุดเก่า
+    """
+    os.makedirs(path, exist_ok=True)
+    out = tempfile.mkdtemp(prefix=time.strftime(f"{BUILD_PREFIX}%Y%m%d-%H%M%S-"), dir=path)
+    build = os.path.basename(out)
+    np.save(os.path.join(out, "ids.npy"), np.array(ids))
+    np.save(os.path.join(out, "titles.npy"), np.array(titles))
+    np.save(os.path.join(out, "categories.npy"), np.array(categories))
+    np.save(os.path.join(out, "prices.npy"), np.array(prices, dtype=np.float32))
+    for mode, (idx, scores) in neighbors.items():
+        np.save(os.path.join(out, f"{mode}_idx.npy"), idx)
+        np.save(os.path.join(out, f"{mode}_scores.npy"), scores)
+
+    # meta.json เขียนท้ายสุด (เขียนไฟล์ชั่วคราวแล้ว os.replace): api.py ใช้ไฟล์นี้เป็นตัวบอกว่าตารางชุดใหม่พร้อมแล้ว
+    meta = {"dir": build, "modes": sorted(neighbors), "top_n": k, "count": len(ids), "source": source,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    tmp = os.path.join(path, "meta.json.tmp")
+    with open(tmp, mode='w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(path, "meta.json"))
+    _remove_old_builds(path, build)
+
+
+def _remove_old_builds(path, keep):
+    # ลบไฟล์ที่ยังถูก mmap อยู่ได้ (Linux/macOS เก็บ inode ไว้จนกว่า api.py จะปล่อย)
+    # ลบเฉพาะโฟลเดอร์ build-* ที่ save_table สร้าง ไฟล์อื่นใน --out (เช่น --out .) ไม่แตะ
+    for name in os.listdir(path):
+        target = os.path.join(path, name)
+        if name == keep or not _BUILD_DIR.match(name) or not os.path.isdir(target):
+            continue
+        try:
+            shutil.rmtree(target)
+        except OSError as e:
+            print(f"⚠️ ลบตารางเก่า {target} ไม่ได้ ({e}) - จะลองใหม่รอบหน้า")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute item-to-item neighbors for /related")
+    parser.add_argument("--top-n", type=int, default=DEFAULT_TOP_N)
+    parser.add_argument("--cross-category", action="store_true",
+                        help="คำนวณชุด 'bundle' (เพื่อนบ้านที่อยู่คนละหมวด) เพิ่มด้วย")
+    parser.add_argument("--snapshot", help="อ่าน vector จาก snapshot .jsonl ของ ingest.py แทนการดึงจาก OpenSearch")
+    parser.add_argument("--out", default=RELATED_DIR)
+    parser.add_argument("--row-block", type=int, default=ROW_BLOCK)
+    parser.add_argument("--col-block", type=int, default=COL_BLOCK)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    t0 = time.perf_counter()
+    vectors, ids, titles, categories, prices = export_vectors(args.out, args.snapshot)
+    print(f"📦 Exported {len(ids):,} vectors ({vectors.shape[1]} dim)")
+
+    _normalize_inplace(vectors)
+    _, category_codes = np.unique(np.array(categories), return_inverse=True)
+    neighbors = top_neighbors(vectors, category_codes, args.top_n, args.cross_category,
+                              args.row_block, args.col_block)
+    save_table(args.out, ids, titles, categories, prices, neighbors, args.top_n,
+               args.snapshot or "opensearch")
+
+    # vectors.npy เป็นไฟล์ชั่วคราว ลบทิ้งได้เลย (ตารางจริงไม่ได้ใช้)
+    del vectors
+    os.remove(os.path.join(args.out, "vectors.npy"))
+    print(f"✅ Related table saved to '{args.out}' in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
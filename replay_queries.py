@@ -0,0 +1,209 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from query_log import read_entries
+
+# --- Config ---
+DEFAULT_URL = "http://localhost:8000"
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 30
+WORST_SHOWN = 10
+
+
+def overlap(logged_ids, replay_ids):
+    """สัดส่วนสินค้าที่ตรงกันใน top-k (ผลว่างทั้งคู่ = ตรงกัน)"""
+    a, b = set(logged_ids), set(replay_ids)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / max(len(a), len(b))
+
+
+def schedule(entries, speed=1.0, qps=None):
+    """เวลาที่ต้องยิงแต่ละ query (วินาทีนับจากเริ่ม): ตาม log จริง / เร่ง-ชะลอด้วย speed / หรือ qps คงที่"""
+    if qps:
+        return [i / qps for i in range(len(entries))]
+    if not speed:
+        return [0.0] * len(entries)
+    first = entries[0]["ts"]
+    return [(entry["ts"] - first) / speed for entry in entries]
+
+
+def replay_one(session, url, entry, args):
+    params = {"q": entry["q"], "speculative": str(entry.get("speculative", True)).lower()}
+    if args.pin_expansion and entry.get("expansion"):
+        params["expansion"] = entry["expansion"]
+    if args.no_cache:
+        params["use_cache"] = "false"
+
+    t0 = time.perf_counter()
+    try:
+        response = session.get(f"{url}/search", params=params, timeout=args.timeout)
+        response.raise_for_status()
+        body = response.json()
+        error = body.get("error")
+    except Exception as e:
+        body, error = {}, str(e)
+    latency = (time.perf_counter() - t0) * 1000
+
+    replay_ids = [item["id"] for item in body.get("data", [])]
+    logged_ids = [doc_id for doc_id, score in entry.get("results", [])]
+    return {
+        "q": entry["q"],
+        "logged_ms": entry.get("total_ms"),
+        "replay_ms": round(latency, 2),
+        "logged_served_by": entry.get("served_by"),
+        "replay_served_by": "semantic_cache" if body.get("cache", {}).get("hit") else body.get("served_by"),
+        "overlap": None if error else round(overlap(logged_ids, replay_ids), 4),
+        "top1_same": bool(logged_ids and replay_ids and logged_ids[0] == replay_ids[0]),
+        "error": error,
+    }
+
+
+def run_replay(entries, args):
+    offsets = schedule(entries, args.speed, args.qps)
+    results = [None] * len(entries)
+    lags = []
+    local = threading.local()
+
+    def task(i, due):
+        # วัด lag = ยิงช้ากว่ากำหนดเท่าไร (ถ้าสูง แปลว่าฝั่ง replay เองไม่ทัน ต้องเพิ่ม --concurrency)
+        lags.append(time.perf_counter() - start - due)
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        results[i] = replay_one(local.session, args.url, entries[i], args)
+
+    # open-loop: ยิงตามเวลาใน log ไม่รอคำตอบก่อนหน้า build ที่ช้าจะเห็น latency สะสมเหมือนของจริง
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i, due in enumerate(offsets):
+            wait = due - (time.perf_counter() - start)
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(task, i, due)
+    return results, lags, time.perf_counter() - start
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    arr = np.asarray(values, dtype=float)
+    stats = {name: round(float(np.percentile(arr, p)), 1) for name, p in (("p50", 50), ("p90", 90), ("p99", 99))}
+    stats["max"] = round(float(arr.max()), 1)
+    return stats
+
+
+def build_report(results, lags, wall):
+    ok = [r for r in results if not r["error"]]
+    overlaps = [r["overlap"] for r in ok]
+    return {
+        "queries": len(results),
+        "errors": len(results) - len(ok),
+        "wall_seconds": round(wall, 1),
+        "achieved_qps": round(len(results) / wall, 1) if wall else None,
+        "send_lag_ms": percentiles([lag * 1000 for lag in lags]),
+        "latency_ms": {
+            "logged": percentiles([r["logged_ms"] for r in ok if r["logged_ms"] is not None]),
+            "replay": percentiles([r["replay_ms"] for r in ok]),
+        },
+        "overlap": {
+            "mean": round(float(np.mean(overlaps)), 4) if overlaps else None,
+            "p10": round(float(np.percentile(overlaps, 10)), 4) if overlaps else None,
+            "top1_same": round(sum(r["top1_same"] for r in ok) / len(ok), 4) if ok else None,
+        },
+        "served_by": {
+            "logged": dict(Counter(r["logged_served_by"] for r in results)),
+            "replay": dict(Counter(r["replay_served_by"] for r in ok)),
+        },
+        "worst_overlap": sorted(ok, key=lambda r: r["overlap"])[:WORST_SHOWN],
+    }
+
+
+def print_report(report):
+    print(f"\n📊 Replay report: {report['queries']:,} queries, {report['errors']:,} errors, "
+          f"{report['wall_seconds']}s ({report['achieved_qps']} q/s)")
+    print(f"   {'latency ms':<12} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for name, stats in report["latency_ms"].items():
+        if stats:
+            print(f"   {name:<12} {stats['p50']:>8} {stats['p90']:>8} {stats['p99']:>8} {stats['max']:>8}")
+    lag = report["send_lag_ms"]
+    if lag:
+        print(f"   send lag p99 : {lag['p99']} ms")
+    ov = report["overlap"]
+    print(f"   overlap@k    : mean {ov['mean']}, p10 {ov['p10']}, same top-1 {ov['top1_same']}")
+    print(f"   served_by    : logged {report['served_by']['logged']}")
+    print(f"                  replay {report['served_by']['replay']}")
+    if report["worst_overlap"]:
+        print("   lowest overlap:")
+        for r in report["worst_overlap"]:
+            print(f"     {r['overlap']:.2f}  {r['q']}")
+
+
+def check_thresholds(report, args):
+    failures = []
+    logged, replay = report["latency_ms"]["logged"], report["latency_ms"]["replay"]
+    if args.max_p99_ratio and logged and replay and replay["p99"] > logged["p99"] * args.max_p99_ratio:
+        failures.append(f"p99 {replay['p99']}ms > {args.max_p99_ratio}x logged {logged['p99']}ms")
+    mean = report["overlap"]["mean"]
+    if args.min_overlap and mean is not None and mean < args.min_overlap:
+        failures.append(f"mean overlap {mean} < {args.min_overlap}")
+    if report["errors"] and (args.max_p99_ratio or args.min_overlap):
+        failures.append(f"{report['errors']} errors")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a captured query log against a running API and diff it")
+    parser.add_argument("logs", nargs="+", help="ไฟล์ / โฟลเดอร์ query_logs (รวมไฟล์ที่หมุนแล้ว)")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="เร่งเวลาใน log (2 = เร็วขึ้นสองเท่า, 0 = ยิงรวดเดียวตาม --concurrency)")
+    parser.add_argument("--qps", type=float, help="ยิงด้วยอัตราคงที่แทนเวลาใน log")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--limit", type=int, help="replay แค่ N query แรก")
+    parser.add_argument("--pin-expansion", action="store_true",
+                        help="ส่งคำขยายจาก log ไปด้วย (ผลไม่ขึ้นกับ AI รอบนี้ เทียบ relevance ได้ตรงกว่า)")
+    parser.add_argument("--no-cache", action="store_true", help="ข้าม semantic cache ของ API")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--out", help="บันทึก report เป็น JSON")
+    parser.add_argument("--max-p99-ratio", type=float,
+                        help="exit 1 ถ้า p99 ของ replay เกิน N เท่าของ log (ใช้ใน CI)")
+    parser.add_argument("--min-overlap", type=float, help="exit 1 ถ้า overlap เฉลี่ยต่ำกว่านี้")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    entries = [e for e in read_entries(args.logs) if e.get("q")]
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        print("❌ ไม่พบ query ใน log")
+        return 1
+
+    span = entries[-1]["ts"] - entries[0]["ts"]
+    print(f"🔁 Replaying {len(entries):,} queries (logged over {span:.0f}s) against {args.url}")
+    results, lags, wall = run_replay(entries, args)
+    report = build_report(results, lags, wall)
+    print_report(report)
+
+    if args.out:
+        with open(args.out, mode='w', encoding='utf-8') as f:
+            json.dump({**report, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Report saved to {args.out}")
+
+    failures = check_thresholds(report, args)
+    for failure in failures:
+        print(f"❌ Regression: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
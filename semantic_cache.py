@@ -0,0 +1,134 @@
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticCache:
+    """Cache ผลค้นหาตาม "ความหมาย" ของ query ไม่ใช่ตัวอักษร
+
+    คำค้นที่ถามเรื่องเดียวกัน (เช่น "อยากทำหมูกระทะ" กับ "ของทำหมูกระทะ") มี vector ใกล้กันมาก
+    ถ้า cosine similarity >= threshold ก็ตอบผลเดิมได้เลย ไม่ต้องเรียก Ollama / OpenSearch ซ้ำ
+    เก็บ vector ไว้ใน matrix ขนาดคงที่แล้วค้นแบบ brute-force (หลักพันรายการใช้เวลาไม่ถึงมิลลิวินาที)
+    """
+
+    def __init__(self, dimension, max_size=1024, threshold=0.95, ttl=600):
+        self.dimension = dimension
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_size, dimension), dtype=np.float32)
+        self._stored_at = np.zeros(max_size)
+        self._last_used = np.zeros(max_size)
+        self._occupied = np.zeros(max_size, dtype=bool)
+        self._keys = [None] * max_size
+        self._values = [None] * max_size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _normalize(self, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _live_mask(self, now):
+        mask = self._occupied
+        if self.ttl:
+            mask = mask & (self._stored_at >= now - self.ttl)
+        return mask
+
+    def _best_match(self, vector, now):
+        live = self._live_mask(now)
+        if not live.any():
+            return None, 0.0
+        sims = self._vectors @ vector
+        sims[~live] = -1.0
+        slot = int(np.argmax(sims))
+        return slot, float(sims[slot])
+
+    def get(self, vector):
+        """คืน (value, similarity, query เดิมที่ match) หรือ None ถ้าไม่มีอะไรใกล้พอ"""
+        vector = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            if vector.shape[0] != self.dimension:
+                # vector จากโมเดลเก่าที่ encode ไว้ก่อนสลับโมเดล
+                self.misses += 1
+                return None
+            slot, sim = self._best_match(vector, now)
+            if slot is None or sim < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[slot] = now
+            return self._values[slot], sim, self._keys[slot]
+
+    def put(self, vector, key, value, generation=None):
+        """เก็บผลลัพธ์ (ข้ามถ้ามีการ invalidate ระหว่างที่ request นี้กำลังค้นอยู่)"""
+        vector = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+
+            slot, sim = self._best_match(vector, now)
+            if slot is None or sim < self.threshold:
+                free = np.flatnonzero(~self._live_mask(now))
+                if len(free):
+                    slot = int(free[0])
+                else:
+                    # เต็มแล้ว: ไล่ตัวที่ไม่ได้ใช้นานที่สุดออก (LRU)
+                    slot = int(np.argmin(self._last_used))
+                    self.evictions += 1
+
+            self._vectors[slot] = vector
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+            self._occupied[slot] = True
+            self._keys[slot] = key
+            self._values[slot] = value
+            return True
+
+    def invalidate(self, dimension=None):
+        """ล้างทั้งหมด (เรียกตอน index ถูก reload / ข้อมูลสินค้าเปลี่ยน / สลับโมเดลที่มิติไม่เท่าเดิม)"""
+        with self._lock:
+            if dimension and dimension != self.dimension:
+                self.dimension = dimension
+                self._vectors = np.zeros((self.max_size, dimension), dtype=np.float32)
+            self.generation += 1
+            self.invalidations += 1
+            self._occupied[:] = False
+            self._keys = [None] * self.max_size
+            self._values = [None] * self.max_size
+
+    def discard(self, predicate):
+        """ลบเฉพาะ entry ที่ predicate(value) เป็นจริง เช่นผลค้นหาที่มีสินค้าที่ราคาเพิ่งเปลี่ยน"""
+        with self._lock:
+            self.generation += 1
+            removed = 0
+            for slot in np.flatnonzero(self._occupied):
+                if predicate(self._values[slot]):
+                    self._occupied[slot] = False
+                    self._keys[slot] = self._values[slot] = None
+                    removed += 1
+            return removed
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(self._live_mask(time.monotonic()).sum()),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "generation": self.generation,
+            }
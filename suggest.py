@@ -0,0 +1,264 @@
+import heapq
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+import numpy as np
+
+from text_builder import normalize_thai
+
+MAX_KEY_LEN = 24        # ตัด key ให้สั้นลงเพื่อประหยัดแรม (prefix ที่ยาวกว่านี้จะเช็คซ้ำกับข้อความเต็ม)
+PRECOMPUTE_LEN = 2      # prefix สั้นกว่าหรือเท่านี้ คำนวณคำตอบไว้ล่วงหน้า (ช่วงใน array กว้างเกินจะ scan ทุก keystroke)
+DEFAULT_LIMIT = 8
+# key ที่ตรงกับต้นคำได้คะแนนคูณนี้: คำที่ขึ้นต้นด้วยสิ่งที่พิมพ์มาก่อน เว้นแต่คำกลางคำจะนิยมกว่ามาก
+# (ข้อมูล gen_*: "น้ำ" -> "น้ำยาบ้วนปาก" / "น้ำดื่ม" มาก่อน "ครีมอาบน้ำ" ที่มี SKU มากกว่า 2-3 เท่า
+#  แต่ "หมู" ยังเห็น "ลูกชิ้นหมู" ก่อน title ยาวๆ ที่ขึ้นต้นด้วยหมูแต่มีแค่ไม่กี่ SKU)
+HEAD_BOOST = 4.0
+PATCH_MAX_KEYS = 2000   # add() ที่เปลี่ยน key ไม่เกินนี้ แทรก/ลบใน array เดิม มากกว่านี้ merge ใหม่ทั้งก้อน
+
+_THAI_LEADING_VOWELS = set("เแโใไ")
+# สระ/วรรณยุกต์ที่เกาะกับพยัญชนะตัวหน้า ขึ้นต้นคำไม่ได้
+_THAI_DEPENDENT = set("ะัาำิีึืฺุู็่้๊๋์ํ๎ฯๆ")
+
+
+def normalize_text(text):
+    """ทำข้อความให้อยู่รูปเดียวกันก่อนเทียบ: normalize_thai แล้วแปลงเป็นตัวเล็ก"""
+    return normalize_thai(text).lower()
+
+
+def key_starts(text):
+    """ตำแหน่งที่ผู้ใช้น่าจะเริ่มพิมพ์ได้
+
+    ภาษาไทยไม่มีช่องว่างระหว่างคำ (เช่น "หมูกระทะ") จึงให้ทุกพยัญชนะที่ไม่ได้ตามหลังสระหน้า
+    เป็นจุดเริ่มได้ พิมพ์ "กระทะ" ก็เจอ ส่วนภาษาอังกฤษ/ตัวเลขเริ่มได้เฉพาะต้นคำ
+    """
+    starts = []
+    prev = " "
+    for i, ch in enumerate(text):
+        if ch == " ":
+            prev = ch
+            continue
+        if prev == " " or not prev.isalnum():
+            starts.append(i)
+        elif "\u0e00" <= ch <= "\u0e7f" and ch not in _THAI_DEPENDENT and prev not in _THAI_LEADING_VOWELS:
+            starts.append(i)
+        prev = ch
+    return [i for i in starts if len(text) - i >= 2 or i == 0]
+
+
+class _Snapshot:
+    """ข้อมูลที่ใช้ตอบ (อ่านอย่างเดียว) สร้างใหม่ทั้งก้อนแล้วสลับ reference จึงไม่ต้อง lock ตอนค้น"""
+
+    def __init__(self, keys, term_ids, heads, terms, norms, weights, kinds):
+        self.keys = keys            # sorted list ของ key (ตัดยาวไม่เกิน MAX_KEY_LEN)
+        self.terms = terms
+        self.norms = norms
+        self.weights = weights
+        self.kinds = kinds
+        self.top = {}
+        # array ขนานกับ keys: term ของ key และคะแนนจัดอันดับ (น้ำหนักสูงก่อน ถ้าเท่ากันคำสั้นก่อน)
+        # key ที่ตรงกับต้นคำได้น้ำหนัก x HEAD_BOOST
+        self.key_terms = np.asarray(term_ids, dtype=np.int32)
+        self.key_heads = np.asarray(heads, dtype=bool)
+        rank = np.asarray([w - len(n) / 1000.0 for w, n in zip(weights, norms)], dtype=np.float64)
+        self.key_rank = rank[self.key_terms] * np.where(self.key_heads, HEAD_BOOST, 1.0) if len(term_ids) else np.zeros(0)
+
+    def top_in_range(self, lo, hi, limit, must_contain=None):
+        """term อันดับต้นๆ ในช่วง keys[lo:hi] (term เดียวกันมีหลาย key จึงต้องตัดซ้ำ)"""
+        if hi <= lo:
+            return []
+        ranks = self.key_rank[lo:hi]
+        want = limit * 4
+        while True:
+            if want < len(ranks):
+                cand = np.argpartition(-ranks, want - 1)[:want]
+                cand = cand[np.argsort(-ranks[cand], kind="stable")]
+            else:
+                cand = np.argsort(-ranks, kind="stable")
+            picked, seen = [], set()
+            for tid in self.key_terms[lo + cand].tolist():
+                if tid in seen or self.weights[tid] <= 0:
+                    continue
+                if must_contain and must_contain not in self.norms[tid]:
+                    continue
+                seen.add(tid)
+                picked.append(tid)
+                if len(picked) == limit:
+                    return picked
+            if want >= len(ranks):
+                return picked
+            want *= 4
+
+
+class PrefixIndex:
+    """Typeahead index: sorted array ของ suffix ที่จุดเริ่มคำ + bisect หา prefix range"""
+
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self._lock = threading.Lock()   # กันการ rebuild ซ้อนกัน (ฝั่งค้นไม่ต้อง lock)
+        self._snap = _Snapshot([], [], [], [], [], [], [])
+        self._term_id = {}
+
+    def __len__(self):
+        snap = self._snap
+        return sum(1 for w in snap.weights if w > 0)
+
+    @staticmethod
+    def _entries(norm, term_id):
+        return [(norm[i:i + MAX_KEY_LEN], term_id, i == 0) for i in key_starts(norm)]
+
+    def update(self, weighted_terms, replace=True):
+        """รับ {(term, kind): weight} แล้ว rebuild เฉพาะส่วนที่เปลี่ยน
+
+        replace=True คือ catalog ชุดใหม่ทั้งหมด (term ที่ไม่มีในชุดใหม่จะหายไป)
+        replace=False คือบวก/ลบน้ำหนักจากเดิม เช่นสินค้าที่เพิ่ม / เปลี่ยนชื่อ / ลบผ่าน API (น้ำหนักเหลือ 0 = หายไป)
+        term ใหม่เท่านั้นที่ต้องสร้าง key ใหม่ ที่เหลือ merge กับ array เดิมแบบ O(n)
+        ถ้าเปลี่ยนไม่กี่ term (replace=False) แทรก/ลบ key ตรงตำแหน่ง และคำนวณ top ใหม่เฉพาะ prefix ที่โดน
+        """
+        with self._lock:
+            old = self._snap
+            terms, norms, kinds = list(old.terms), list(old.norms), list(old.kinds)
+            weights = [0] * len(terms) if replace else list(old.weights)
+            touched = set()
+            for (term, kind), weight in weighted_terms.items():
+                norm = normalize_text(term)
+                if not norm or weight == 0 or (replace and weight < 0):
+                    continue
+                term_id = self._term_id.get(norm)
+                if term_id is None:
+                    if weight < 0:
+                        continue
+                    term_id = len(terms)
+                    self._term_id[norm] = term_id
+                    terms.append(term)
+                    norms.append(norm)
+                    kinds.append(kind)
+                    weights.append(0)
+                weights[term_id] += weight
+                touched.add(term_id)
+
+            dead = sum(1 for w in weights if w <= 0)
+            if dead > len(weights) // 2:
+                self._compact(terms, norms, kinds, weights)
+                return
+
+            # ต้องสร้าง key เฉพาะ term ใหม่ หรือ term ที่เคยหายไปแล้วกลับมา
+            had_keys = len(old.weights)
+            alive_before = [tid < had_keys and old.weights[tid] > 0 for tid in range(len(weights))]
+            if not replace:
+                added = [tid for tid in touched if weights[tid] > 0 and not alive_before[tid]]
+                removed = [tid for tid in touched if weights[tid] <= 0 and alive_before[tid]]
+                if len(self._entries_of(added + removed, norms)) <= PATCH_MAX_KEYS:
+                    self._snap = self._patch(old, added, removed, touched, terms, norms, weights, kinds)
+                    return
+
+            added = [tid for tid, w in enumerate(weights) if w > 0 and not alive_before[tid]]
+            # term ที่หายไปจาก catalog ไม่ต้องเก็บ key ไว้ให้เสียเวลา scan
+            kept = [e for e in zip(old.keys, old.key_terms.tolist(), old.key_heads.tolist()) if weights[e[1]] > 0]
+            new = sorted(e for tid in added for e in self._entries(norms[tid], tid))
+            snap = self._snapshot(list(heapq.merge(kept, new)), terms, norms, weights, kinds)
+            self._precompute(snap)
+            self._snap = snap
+
+    def add(self, weighted_terms):
+        self.update(weighted_terms, replace=False)
+
+    def _patch(self, old, added, removed, touched, terms, norms, weights, kinds):
+        """snapshot ใหม่จากของเดิม: ลบ key ของ term ที่หายไป แทรก key ของ term ใหม่ (ไม่ sort / merge ทั้ง array)"""
+        keys, term_ids, heads = list(old.keys), old.key_terms.tolist(), old.key_heads.tolist()
+        for tid in removed:
+            for key, _, _ in self._entries(norms[tid], tid):
+                i = bisect_left(keys, key)
+                while term_ids[i] != tid:
+                    i += 1
+                del keys[i], term_ids[i], heads[i]
+        for key, tid, head in self._entries_of(added, norms):
+            # ลำดับของ key ที่เท่ากันไม่มีผลกับการหา range แทรกท้ายกลุ่มได้เลย
+            i = bisect_right(keys, key)
+            keys.insert(i, key)
+            term_ids.insert(i, tid)
+            heads.insert(i, head)
+
+        snap = _Snapshot(keys, term_ids, heads, terms, norms, weights, kinds)
+        # term id ไม่เปลี่ยน (ไม่ได้ compact) คำตอบของ prefix อื่นใช้ของเดิมได้
+        snap.top = dict(old.top)
+        stale = {key[:n] for key, _, _ in self._entries_of(touched, norms)
+                 for n in range(1, min(PRECOMPUTE_LEN, len(key)) + 1)}
+        for p in stale:
+            top = snap.top_in_range(*self._range(snap, p), self.limit)
+            if top:
+                snap.top[p] = top
+            else:
+                snap.top.pop(p, None)
+        return snap
+
+    def _entries_of(self, term_ids, norms):
+        return [e for tid in term_ids for e in self._entries(norms[tid], tid)]
+
+    def _compact(self, terms, norms, kinds, weights):
+        live = [i for i, w in enumerate(weights) if w > 0]
+        terms = [terms[i] for i in live]
+        norms = [norms[i] for i in live]
+        kinds = [kinds[i] for i in live]
+        weights = [weights[i] for i in live]
+        self._term_id = {norm: tid for tid, norm in enumerate(norms)}
+        entries = sorted(e for tid, norm in enumerate(norms) for e in self._entries(norm, tid))
+        snap = self._snapshot(entries, terms, norms, weights, kinds)
+        self._precompute(snap)
+        self._snap = snap
+
+    @staticmethod
+    def _snapshot(entries, terms, norms, weights, kinds):
+        keys, term_ids, heads = (list(col) for col in zip(*entries)) if entries else ([], [], [])
+        return _Snapshot(keys, term_ids, heads, terms, norms, weights, kinds)
+
+    def _precompute(self, snap):
+        prefixes = {key[:n] for key in snap.keys for n in range(1, min(PRECOMPUTE_LEN, len(key)) + 1)}
+        snap.top = {p: snap.top_in_range(*self._range(snap, p), self.limit) for p in prefixes}
+
+    @staticmethod
+    def _range(snap, probe):
+        lo = bisect_left(snap.keys, probe)
+        return lo, bisect_left(snap.keys, probe + "\U0010ffff", lo)
+
+    def suggest(self, prefix, limit=None):
+        limit = max(1, min(limit or self.limit, self.limit))   # limit ติดลบจาก query string ไม่ให้พังใน argpartition
+        snap = self._snap
+        p = normalize_text(prefix)
+        if not p:
+            return []
+
+        if len(p) <= PRECOMPUTE_LEN:
+            term_ids = snap.top.get(p, [])[:limit]
+        else:
+            lo, hi = self._range(snap, p[:MAX_KEY_LEN])
+            term_ids = snap.top_in_range(lo, hi, limit, p if len(p) > MAX_KEY_LEN else None)
+
+        return [{"text": snap.terms[tid], "kind": snap.kinds[tid], "weight": snap.weights[tid]} for tid in term_ids]
+
+
+def vocabulary_terms():
+    """ชื่อสินค้า / แบรนด์ จาก vocab ของตัวสร้างข้อมูล (ใช้ได้แม้ index ยังว่าง)"""
+    import gen_big_data
+    import gen_white_rose_data
+
+    terms = set()
+    for module in (gen_white_rose_data, gen_big_data):
+        for data in module.categories.values():
+            terms.update((p, "product") for p in data["products"])
+            terms.update((b, "brand") for b in data["brands"])
+    for module in (gen_white_rose_data, gen_big_data):
+        terms.update((c, "category") for c in module.categories)
+    return terms
+
+
+def catalog_weights(titles, vocab):
+    """ความนิยม = จำนวน SKU ที่มีคำนั้นอยู่ใน title (title เองนับตามจำนวน SKU ที่ใช้ชื่อซ้ำ)"""
+    title_counts = Counter(titles)
+    weights = {(title, "title"): count for title, count in title_counts.items()}
+    normalized = [(normalize_text(title), count) for title, count in title_counts.items()]
+    for term, kind in vocab:
+        norm = normalize_text(term)
+        hits = sum(count for title, count in normalized if norm in title)
+        weights[(term, kind)] = weights.get((term, kind), 0) + hits + 1
+    return weights
@@ -0,0 +1,168 @@
+import time
+import unicodedata
+
+TEXT_MODES = ("full", "dedup")
+DEFAULT_TEXT_MODE = "dedup"
+DEFAULT_TOKEN_BUDGET = 64       # token ของเนื้อหา (ไม่นับ special token) title / category ไม่ถูกตัด ตัดเฉพาะ description
+LEGACY_TEXT = {"mode": "full", "token_budget": 0}   # index ที่สร้างก่อนมี text config
+
+_ZERO_WIDTH = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"))
+_PUNCT = "()[]{}:;,.-–|/&\"'"
+# คำนำหน้าค่าใน description ("ยี่ห้อ X", "ขนาด Y") ถ้าค่าถูกตัดเพราะซ้ำ ป้ายก็ไม่ต้องเหลือ
+FIELD_LABELS = {"ยี่ห้อ", "ขนาด", "หมวดหมู่", "หมวด", "แบรนด์"}
+
+
+def normalize_thai(text):
+    """NFC, ตัด zero-width, แก้สระที่พิมพ์ผิดบ่อย (เ+เ -> แ, นิคหิต+า -> ำ), ยุบช่องว่าง (ไม่แปลงตัวเล็ก)"""
+    text = unicodedata.normalize("NFC", text or "").translate(_ZERO_WIDTH)
+    text = text.replace("เเ", "แ").replace("ํา", "ำ")
+    return " ".join(text.split())
+
+
+def legacy_text(row):
+    """ข้อความแบบเดิมของทุก importer (title + description + category ต่อกันตรงๆ)"""
+    return f"{row['title']} {row['description']} {row['category']}"
+
+
+def _key(word):
+    return word.strip(_PUNCT).lower()
+
+
+class TextBuilder:
+    """สร้างข้อความที่ส่งเข้า model.encode (ฝั่ง doc และฝั่ง query ต้องใช้ config เดียวกัน)
+
+    mode="dedup": ตัดคำใน description ที่ซ้ำกับ title / category ออก (ข้อมูล gen_*.py ซ้ำเกือบทั้งวงเล็บ)
+    แล้วคุมความยาวไม่ให้เกิน token_budget ด้วย tokenizer ของโมเดลเอง ตัดท้าย description ก่อน
+    title กับ category จึงไม่โดน max_seq_length ตัดทิ้งเหมือนแบบเดิม
+    """
+
+    def __init__(self, mode=DEFAULT_TEXT_MODE, token_budget=DEFAULT_TOKEN_BUDGET, tokenizer=None, max_tokens=None):
+        if mode not in TEXT_MODES:
+            raise ValueError(f"unknown text mode '{mode}' (ใช้ได้: {', '.join(TEXT_MODES)})")
+        self.mode = mode
+        self.token_budget = (token_budget or 0) if mode != "full" else 0
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens        # เพดานจริงของโมเดล (max_seq_length - special token)
+        self.rows = 0
+        self.tokens = 0
+        self.legacy_tokens = 0
+        self.truncated = 0
+
+    @classmethod
+    def from_config(cls, config, model=None):
+        tokenizer = getattr(model, "tokenizer", None)
+        max_seq = getattr(model, "max_seq_length", None)
+        return cls(config.get("mode", "full"), config.get("token_budget", 0), tokenizer,
+                   max_seq - 2 if max_seq else None)
+
+    def config(self):
+        return {"mode": self.mode, "token_budget": self.token_budget}
+
+    # --- ฝั่ง query (api.py) ---
+
+    def query(self, text):
+        if self.mode == "full":
+            return text
+        # คำขยายจาก AI มักพูดคำเดิมของผู้ใช้ซ้ำ ตัดซ้ำแบบเดียวกับฝั่ง doc
+        words, seen = [], set()
+        for word in normalize_thai(text).split():
+            key = _key(word)
+            if key and key not in seen:
+                seen.add(key)
+                words.append(word)
+        return " ".join(words)
+
+    # --- ฝั่ง doc (ingest.py / live_writer.py / reembed.py) ---
+
+    def _parts(self, row):
+        title = normalize_thai(str(row.get('title') or ""))
+        category = normalize_thai(str(row.get('category') or ""))
+        seen = {_key(w) for w in f"{title} {category}".split()}
+        words = normalize_thai(str(row.get('description') or "")).split()
+        kept = []
+        for i, word in enumerate(words):
+            key = _key(word)
+            if not key or key in seen:
+                continue
+            if key in FIELD_LABELS and (i + 1 == len(words) or _key(words[i + 1]) in seen):
+                continue
+            seen.add(key)
+            kept.append(word.strip(_PUNCT))
+        return title, " ".join(kept), category
+
+    @staticmethod
+    def _join(title, description, category):
+        return " ".join(part for part in (title, description, category) if part)
+
+    def _lengths(self, texts):
+        ids = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(x) for x in ids]
+
+    def _cut(self, text, room):
+        """ตัดข้อความให้เหลือ room token แรก (ตัดตามตำแหน่งตัวอักษรจาก offset ไม่ decode กลับ)"""
+        if room <= 0:
+            return ""
+        try:
+            offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        except (NotImplementedError, KeyError, ValueError):
+            ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+            return self.tokenizer.decode(ids[:room]) if len(ids) > room else text
+        return text[:offsets[room - 1][1]] if len(offsets) > room else text
+
+    def build(self, rows):
+        """คืนข้อความของทุกแถว (ทำทีละ batch: tokenizer แบบ batch เร็วกว่าเรียกทีละแถวมาก)"""
+        if self.mode == "full":
+            texts = [legacy_text(row) for row in rows]
+            lengths = self._lengths(texts) if self.tokenizer else None
+            self._count(len(texts), lengths, lengths)
+            return texts
+
+        parts = [self._parts(row) for row in rows]
+        texts = [self._join(*p) for p in parts]
+        if self.tokenizer is None:
+            self._count(len(texts), None, None)
+            return texts
+
+        lengths = self._lengths(texts)
+        if self.token_budget:
+            over = [i for i, n in enumerate(lengths) if n > self.token_budget]
+            if over:
+                fixed = self._lengths([self._join(parts[i][0], "", parts[i][2]) for i in over])
+                for i, base in zip(over, fixed):
+                    title, description, category = parts[i]
+                    texts[i] = self._join(title, self._cut(description, self.token_budget - base - 1), category)
+                    lengths[i] = max(base, min(lengths[i], self.token_budget))
+                self.truncated += len(over)
+        self._count(len(texts), lengths, self._lengths([legacy_text(row) for row in rows]))
+        return texts
+
+    def _count(self, n, lengths, legacy_lengths):
+        self.rows += n
+        if lengths is None:
+            return
+        cap = self.max_tokens or float("inf")   # เกินเพดานโมเดลก็ถูกตัดอยู่ดี ไม่นับเป็นงานที่ทำจริง
+        self.tokens += sum(min(x, cap) for x in lengths)
+        self.legacy_tokens += sum(min(x, cap) for x in legacy_lengths)
+
+    def metrics(self):
+        if not self.rows or not self.tokenizer:
+            return {"rows": self.rows, **self.config()}
+        avg, legacy = self.tokens / self.rows, self.legacy_tokens / self.rows
+        return {"rows": self.rows, **self.config(), "avg_tokens": round(avg, 1),
+                "legacy_avg_tokens": round(legacy, 1),
+                "token_reduction": round(1 - avg / legacy, 4) if legacy else 0.0,
+                "truncated": self.truncated}
+
+
+def compare_encode(model, builder, rows, batch_size=64):
+    """encode ตัวอย่างเดียวกันทั้งแบบเดิมและแบบใหม่ วัดเวลาจริง (ไม่ใช่ประมาณจากจำนวน token)"""
+    legacy = [legacy_text(row) for row in rows]
+    built = TextBuilder(builder.mode, builder.token_budget, builder.tokenizer, builder.max_tokens).build(rows)
+    model.encode(legacy[:batch_size], batch_size=batch_size, show_progress_bar=False)    # warmup
+    timings = {}
+    for name, texts in (("legacy", legacy), ("built", built)):
+        t0 = time.perf_counter()
+        model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+        timings[name] = time.perf_counter() - t0
+    return {"rows": len(rows), "legacy_s": round(timings["legacy"], 3), "built_s": round(timings["built"], 3),
+            "saved": round(1 - timings["built"] / timings["legacy"], 4) if timings["legacy"] else 0.0}